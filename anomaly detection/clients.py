@@ -0,0 +1,8 @@
+# Poisoning attack simulations: runs the federated clients listed in clients.json as virtual clients of one process
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from flower_common.pn_clients import main
+
+main()
@@ -12,10 +12,25 @@ from typing import List, Tuple
 from flwr.common import Metrics
 from typing import Dict, Optional, Tuple
 from collections import OrderedDict
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from flower_common.metrics_sink import MetricsSink, CENTRALIZED, WEIGHTED
+from flower_common.anomaly import AnomalyFedAvg, UpdateScorer, POLICIES
 
 
 warnings.filterwarnings("ignore", category=UserWarning)
+parser = argparse.ArgumentParser()
+parser.add_argument("--anomaly_policy", help="only log the anomaly scores of the updates (log), down-weight (downweight) or exclude (exclude) the clients whose score exceeds the threshold", type=str, choices=POLICIES, default="log")
+parser.add_argument("--anomaly_threshold", help="the anomaly score (the largest z-score of the features of an update) above which a client is suspicious", type=float, default=3.0)
+args = parser.parse_args()
 DEVICE = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+# metrics.bin/metrics.json replace the z*.csv files (see flower_common/metrics_sink.py)
+sink = MetricsSink("metrics")
+# the round of the distributed evaluation is given by evaluate_config, and the centralized evaluation
+# is executed once before the first round and once after each fit
+current_round = {"distributed": 0, "centralized": 0}
 
 
 # local analysis
@@ -26,17 +41,12 @@ def weighted_average(metrics: List[Tuple[int, Metrics]]) -> Metrics:
 
     # local restults
     print(metrics)
-    with open('zdistributed_metrics.csv', 'a') as fd:
-        fd.write(str(sum(accuracies) / sum(examples))+',') # metrics_distributed accuracy at each round (moyenné)
-    with open('zdistributed_losses.csv', 'a') as fd:
-        fd.write(str(sum(losses) / sum(examples))+',') # losses_distributed at each round (moyenné)
-
-    with open('zdistributed_losses_each_client.csv', 'a') as fd:
-        losses_each = [m["loss"] for num_examples, m in metrics]
-        fd.write(str(losses_each) +',') # losses_distributed at each round (of each client)
-    with open('zdistributed_metrics_each_client.csv', 'a') as fd:
-        accuracies_each = [m["accuracy"] for num_examples, m in metrics]
-        fd.write(str(accuracies_each) + ',') # metrics_distributed accuracy at each round (of each client)
+    rnd = current_round["distributed"]
+    for k, (num_examples, m) in enumerate(metrics):
+        sink.log(rnd, m.get("client", k), {"accuracy": m["accuracy"], "loss": m["loss"]})
+    sink.log(rnd, WEIGHTED, {"accuracy": sum(accuracies) / sum(examples), "loss": sum(losses) / sum(examples)})
+    # the distributed evaluation is the last step of a round
+    sink.flush()
 
     return {"accuracy": sum(accuracies) / sum(examples)}
 
@@ -89,10 +99,8 @@ def get_eval_fn(model: torch.nn.Module, toy: bool):
         print("server evaluation")
         print("evaluate du server (eval_fn):", loss, {"accuracy": accuracy})
 
-        with open('zcentralized_metrics.csv', 'a') as fd:
-            fd.write(str(accuracy) + ',')  # accuracy centralized at the end of each round
-        with open('zcentralized_losses.csv', 'a') as fd:
-            fd.write(str(loss) + ',')  # loss centralized at the end of each round
+        sink.log(current_round["centralized"], CENTRALIZED, {"accuracy": accuracy, "loss": loss})
+        current_round["centralized"] += 1
 
         return loss, {"accuracy": accuracy}
 
@@ -145,6 +153,7 @@ def fit_config(rnd: int):
 
 
 def evaluate_config(rnd: int):
+    current_round["distributed"] = rnd
     if rnd < 15:
         changing_train_loader = 0
     else:
@@ -152,7 +161,10 @@ def evaluate_config(rnd: int):
     return {"changing_train_loader": changing_train_loader}
 
 
-strategy = fl.server.strategy.FedAvg(
+# the updates are scored as the replies arrive (see flower_common/anomaly.py)
+strategy = AnomalyFedAvg(
+    scorer=UpdateScorer(policy=args.anomaly_policy, threshold=args.anomaly_threshold),
+    sink=sink,
     evaluate_metrics_aggregation_fn=weighted_average,
     fraction_fit=1.0,
     min_available_clients=1,
@@ -176,3 +188,4 @@ fl.server.start_server(
     config={"num_rounds": 30},
     strategy=strategy,
 )
+sink.flush()
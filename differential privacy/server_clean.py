@@ -12,11 +12,28 @@ from typing import List, Tuple
 from flwr.common import Metrics
 from typing import Dict, Optional, Tuple
 from collections import OrderedDict
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from flower_common.metrics_sink import MetricsSink, CENTRALIZED, WEIGHTED
+
+# metrics.bin/metrics.json replace the z*.csv files (see flower_common/metrics_sink.py)
+sink = MetricsSink("metrics")
+# the round of the distributed evaluation is given by evaluate_config, and the centralized evaluation
+# is executed once before the first round and once after each fit
+current_round = {"distributed": 0, "centralized": 0}
 
 
 def weighted_average(metrics: List[Tuple[int, Metrics]]) -> Metrics:
     accuracies = [num_examples * m["accuracy"] for num_examples, m in metrics]
+    losses = [num_examples * m["loss"] for num_examples, m in metrics]
     examples = [num_examples for num_examples, _ in metrics]
+    rnd = current_round["distributed"]
+    for k, (num_examples, m) in enumerate(metrics):
+        sink.log(rnd, m.get("client", k), {"accuracy": m["accuracy"], "loss": m["loss"]})
+    sink.log(rnd, WEIGHTED, {"accuracy": sum(accuracies) / sum(examples), "loss": sum(losses) / sum(examples)})
+    # the distributed evaluation is the last step of a round
+    sink.flush()
     return {"accuracy": sum(accuracies) / sum(examples)}
 
 
@@ -68,10 +85,8 @@ def get_eval_fn(model: torch.nn.Module, toy: bool):
         print("server evaluation")
         print("evaluate du server (eval_fn):", loss, {"accuracy": accuracy})
 
-        with open('zcentralized_metrics.csv', 'a') as fd:
-            fd.write(str(accuracy) + ',')  # accuracy centralized at the end of each round
-        with open('zcentralized_losses.csv', 'a') as fd:
-            fd.write(str(loss) + ',')  # loss centralized at the end of each round
+        sink.log(current_round["centralized"], CENTRALIZED, {"accuracy": accuracy, "loss": loss})
+        current_round["centralized"] += 1
 
         return loss, {"accuracy": accuracy}
 
@@ -113,6 +128,11 @@ net = Net().to(DEVICE)
 model = net
 
 
+def evaluate_config(rnd: int):
+    current_round["distributed"] = rnd
+    return {}
+
+
 strategy = fl.server.strategy.FedAvg(
     evaluate_metrics_aggregation_fn=weighted_average,
     fraction_fit=1.0,
@@ -124,6 +144,7 @@ strategy = fl.server.strategy.FedAvg(
 
     # new fn
     eval_fn=get_eval_fn(model, True),
+    on_evaluate_config_fn=evaluate_config,
 )
 
 
@@ -133,3 +154,4 @@ fl.server.start_server(
     config={"num_rounds": 30},
     strategy=strategy,
 )
+sink.flush()
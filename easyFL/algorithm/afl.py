@@ -43,14 +43,18 @@ class Server(BasicServer):
             res.append(max(p[i] + lmbd, 0))
         return res
 
-    def test_on_clients(self, round, dataflag='valid'):
+    def test_on_clients(self, round, dataflag='valid', model=None):
+        if model == None: model = self.result_model
         all_metrics = collections.defaultdict(list)
         for c in self.clients:
-            client_metrics = c.test(self.result_model, dataflag)
+            client_metrics = c.test(model, dataflag)
             for met_name, met_val in client_metrics.items():
                 all_metrics[met_name].append(met_val)
         return all_metrics
 
+    def snapshot(self):
+        return copy.deepcopy(self.result_model)
+
     def test(self, model=None):
         if model == None: model = self.result_model
         if self.test_data:
@@ -48,11 +48,11 @@ class Server(BasicServer):
 
     def get_batch_data(self):
         if not self.data_loader:
-            self.data_loader = iter(self.calculator.get_data_loader(self.train_data, batch_size=self.batch_size))
+            self.data_loader = self.calculator.get_batch_iterator(self.train_data, batch_size=self.batch_size)
         try:
             batch_data = next(self.data_loader)
         except StopIteration:
-            self.data_loader = iter(self.calculator.get_data_loader(self.train_data, batch_size=self.batch_size))
+            self.data_loader = self.calculator.get_batch_iterator(self.train_data, batch_size=self.batch_size)
             batch_data = next(self.data_loader)
         return batch_data
 
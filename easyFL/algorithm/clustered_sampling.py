@@ -1,6 +1,7 @@
 from .fedbase import BasicServer, BasicClient
 import numpy as np
 from utils import fmodule
+import utils.sampler
 import copy
 from itertools import product
 from scipy.cluster.hierarchy import linkage, fcluster
@@ -11,6 +12,7 @@ class Server(BasicServer):
         # m = self.clients_per_round, M = self.data_vol = sum(n_i), n_i = self.client_vols[i]
         self.alg = option['alg']
         self.W = None
+        self.samplers = None
         self.paras_name=['alg']
         zero_model = fmodule._model_to_tensor(self.model-self.model).cpu().numpy()
         self.update_history = [copy.deepcopy(zero_model) for _ in range(self.num_clients)]
@@ -120,13 +122,12 @@ class Server(BasicServer):
             return distri_clusters.tolist()
 
     def sample(self):
-        self.W = self.update_w(self.clients_per_round, self.data_vol, self.client_vols, self.alg)
-        all_clients = [cid for cid in range(self.num_clients)]
-        selected_clients = []
-        for k in range(self.clients_per_round):
-            cid = np.random.choice(all_clients, 1, p=self.W[k])[0]
-            selected_clients.append(cid)
-        return list(selected_clients)
+        W = self.update_w(self.clients_per_round, self.data_vol, self.client_vols, self.alg)
+        if W is not self.W or self.samplers is None:
+            # rebuild the alias tables of the clusters only when the weights change
+            self.samplers = [utils.sampler.ClientSampler(wk) for wk in W]
+        self.W = W
+        return [sk.draw(1)[0] for sk in self.samplers]
 
     def get_similarity(self, g1, g2):
         if self.distance_type == "L1":
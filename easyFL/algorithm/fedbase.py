@@ -8,6 +8,12 @@ import utils.fflow as flw
 import utils.network_simulator as ns
 import math
 import collections
+import utils.functional
+import utils.privacy
+import utils.secure_aggregation
+import utils.robust_aggregation
+import utils.sampler
+import torch
 
 class BasicServer:
     def __init__(self, option, model, clients, test_data = None):
@@ -18,6 +24,7 @@ class BasicServer:
         self.test_data = test_data
         self.eval_interval = option['eval_interval']
         self.num_threads = option['num_threads']
+        self.train_mode = option['train_mode']
         # clients settings
         self.clients = clients
         self.num_clients = len(self.clients)
@@ -34,6 +41,8 @@ class BasicServer:
         self.current_round = -1
         # sampling and aggregating methods
         self.sample_option = option['sample']
+        # the alias table of the data volumes is built once for md sampling
+        self.sampler = utils.sampler.ClientSampler(self.client_vols)
         self.agg_option = option['aggregate']
         self.lr = option['learning_rate']
         # names of additional parameters
@@ -41,6 +50,7 @@ class BasicServer:
         self.option = option
         # server calculator
         self.calculator = fmodule.TaskCalculator(fmodule.device)
+        if option.get('dp', 0): utils.privacy.DPSGD.check_model(self.model)
         # virtual clock for calculating time consuming across communication rounds
         self.TIME_UNIT = 1
         self.TIME_ACCESS_BOUND = 100000
@@ -49,6 +59,14 @@ class BasicServer:
             'time_access':[],
             'time_sync':[]
         }
+        # secure aggregation of the local models by pairwise masks
+        self.secure_aggregation = None
+        if option.get('secure_aggregation', 0):
+            if not self.supports_secure_aggregation():
+                raise RuntimeError("Secure aggregation only supports the algorithms with the standard iterate(), pack() and aggregate() of the server and pack() and unpack() of the clients.")
+            if self.agg_option in utils.robust_aggregation.RULES:
+                raise RuntimeError("Secure aggregation only reveals the weighted sum of the models, which can't be aggregated by {}.".format(self.agg_option))
+            self.secure_aggregation = utils.secure_aggregation.SecureAggregation(self.num_clients, option['seed'])
 
     def run(self):
         """
@@ -57,6 +75,8 @@ class BasicServer:
         flw.logger.time_start('Total Time Cost')
         for round in range(self.num_rounds+1):
             print("--------------Round {}--------------".format(round))
+            self.current_round = round
+            if flw.profiler is not None: flw.profiler.start(round)
             flw.logger.time_start('Time Cost')
             if flw.logger.check_if_log(round, self.eval_interval):
                 flw.logger.time_start('Eval Time Cost')
@@ -67,8 +87,10 @@ class BasicServer:
             # decay learning rate
             self.global_lr_scheduler(round)
             flw.logger.time_end('Time Cost')
+            if flw.profiler is not None: flw.profiler.end(round)
         print("=================End==================")
         flw.logger.time_end('Total Time Cost')
+        if self.secure_aggregation is not None: flw.logger.output['secure_aggregation'] = self.secure_aggregation.stats
         # save results as .json file
         flw.logger.save(os.path.join('fedtask', self.option['task'], 'record', flw.output_filename(self.option, self)))
         return
@@ -82,6 +104,9 @@ class BasicServer:
         """
         # sample clients: MD sampling as default
         self.selected_clients = self.sample()
+        if self.secure_aggregation is not None:
+            # set up the pairwise masks among the selected clients
+            self.secure_aggregation.setup(t, self.selected_clients, self.secure_aggregation_weights(self.selected_clients))
         # training
         models = self.communicate(self.selected_clients)['model']
         # aggregate: pk = 1/K as default where K=len(selected_clients)
@@ -99,7 +124,10 @@ class BasicServer:
             :the unpacked response from clients that is created ny self.unpack()
         """
         packages_received_from_clients = []
-        if self.num_threads <= 1:
+        if self.train_mode == 'cohort' and self.can_train_in_lockstep():
+            # training the selected clients in lockstep
+            packages_received_from_clients = self.communicate_in_lockstep(selected_clients)
+        elif self.num_threads <= 1:
             # computing iteratively
             for client_id in selected_clients:
                 response_from_client_id = self.communicate_with(client_id)
@@ -114,6 +142,32 @@ class BasicServer:
         packages_received_from_clients = [pk for pk in packages_received_from_clients if pk]
         return self.unpack(packages_received_from_clients)
 
+    def can_train_in_lockstep(self):
+        """
+        Check whether the selected clients can be trained in lockstep, which requires the standard
+        communicate_with() and the standard local training (i.e. BasicClient.reply() and BasicClient.train()).
+        """
+        if not hasattr(self, '_lockstep'):
+            self._lockstep = type(self).communicate_with is BasicServer.communicate_with \
+                             and all([type(c).reply is BasicClient.reply and type(c).train is BasicClient.train and c.privacy is None for c in self.clients]) \
+                             and utils.functional.can_train_in_lockstep(self.model, self.clients[0].calculator, self.option['optimizer'])
+            if not self._lockstep: print("The local training of {} can't be run in lockstep, and the clients will be trained sequentially.".format(self.name))
+        return self._lockstep
+
+    def communicate_in_lockstep(self, selected_clients):
+        """
+        Communicate with the selected clients as communicate_with() does, where the local training
+        of all the clients is executed in lockstep by utils.functional.train_in_lockstep().
+        :param
+            selected_clients: the clients to communicate with
+        :return
+            the replies from the clients
+        """
+        clients = [self.clients[cid] for cid in selected_clients]
+        models = [c.unpack(self.pack(cid)) for cid, c in zip(selected_clients, clients)]
+        if models: utils.functional.train_in_lockstep(clients, models)
+        return [c.pack(m) for c, m in zip(clients, models)]
+
     def communicate_with(self, client_id):
         """
         Pack the information that is needed for client_id to improve the global model
@@ -125,7 +179,9 @@ class BasicServer:
         # package the necessary information
         svr_pkg = self.pack(client_id)
         # listen for the client's response
-        return self.clients[client_id].reply(svr_pkg)
+        reply = self.clients[client_id].reply(svr_pkg)
+        self.clients[client_id].release_data()
+        return reply
 
     def pack(self, client_id):
         """
@@ -136,9 +192,31 @@ class BasicServer:
         :return
             a dict that only contains the global model as default.
         """
-        return {
+        pkg = {
             "model" : copy.deepcopy(self.model),
         }
+        if self.secure_aggregation is not None: pkg['secagg'] = self.secure_aggregation.client_context(client_id)
+        return pkg
+
+    def supports_secure_aggregation(self):
+        """Check whether the algorithm uses the standard procedures that the secure aggregation is hooked into"""
+        return type(self).iterate is BasicServer.iterate and type(self).pack is BasicServer.pack and type(self).aggregate is BasicServer.aggregate \
+               and all([type(c).pack is BasicClient.pack and type(c).unpack is BasicClient.unpack for c in self.clients])
+
+    def aggregation_weights(self, selected_clients):
+        """
+        The weights pk of the selected clients in the weighted sum Σpk * model_k computed by self.aggregate()
+        :param
+            selected_clients: the ids of the selected clients
+        :return
+            a list of the weights, which are 1 for the uniform aggregation and nk/n otherwise
+        """
+        if self.agg_option == 'uniform': return [1.0 for _ in selected_clients]
+        return [1.0 * self.client_vols[cid] / self.data_vol for cid in selected_clients]
+
+    def secure_aggregation_weights(self, selected_clients):
+        """The weights that the clients multiply their models by before masking, i.e. the pk of self.aggregate()"""
+        return self.aggregation_weights(selected_clients)
 
     def unpack(self, packages_received_from_clients):
         """
@@ -180,19 +258,31 @@ class BasicServer:
         :return
             a list of the ids of the selected clients
         """
-        all_clients = [cid for cid in range(self.num_clients)]
+        self.available_clients = set()
         if self.clients_per_round==self.num_clients:
             # full sampling
-            return all_clients
+            return [cid for cid in range(self.num_clients)]
         # sample clients
         elif self.sample_option == 'uniform':
             # original sample proposed by fedavg
-            selected_clients = list(np.random.choice(all_clients, self.clients_per_round, replace=False))
+            selected_clients = self.sampler.uniform(self.num_clients, self.clients_per_round)
         elif self.sample_option =='md':
             # the default setting that is introduced by FedProx
-            selected_clients = list(np.random.choice(all_clients, self.clients_per_round, replace=True, p=[nk / self.data_vol for nk in self.client_vols]))
+            selected_clients = self.sampler.draw(self.clients_per_round)
+        # sample clients among the available ones, where the inactive clients are rejected and resampled
+        elif self.sample_option == 'uniform_available':
+            selected_clients = self.sampler.uniform(self.num_clients, self.clients_per_round, accept=self.is_available)
+        elif self.sample_option == 'md_available':
+            selected_clients = self.sampler.draw(self.clients_per_round, accept=self.is_available)
         return selected_clients
 
+    def is_available(self, client_id):
+        """Check whether the client is active when it's sampled, and remember the active ones for wait_for_accessibility()"""
+        if self.clients[client_id].is_active():
+            self.available_clients.add(client_id)
+            return True
+        return False
+
     def aggregate(self, models, p=[]):
         """
         Aggregate the locally improved models.
@@ -209,14 +299,19 @@ class BasicServer:
          weighted_scale                 |uniform (default)          |weighted_com (original fedavg)   |other
         ==========================================================================================================================
         N/K * Σpk * model_k             |1/K * Σmodel_k             |(1-Σpk) * w_old + Σpk * model_k  |Σ(pk/Σpk) * model_k
+
+        The robust rules (median, trimmed_mean, krum, multi_krum, geometric_median) are in utils.robust_aggregation.
         """
         if not models: return self.model
+        if isinstance(models[0], utils.secure_aggregation.MaskedVector): return self.aggregate_masked(models, p)
         if self.agg_option == 'weighted_scale':
             K = len(models)
             N = self.num_clients
             return fmodule._model_sum([model_k * pk for model_k, pk in zip(models, p)]) * N / K
         elif self.agg_option == 'uniform':
             return fmodule._model_average(models)
+        elif self.agg_option in utils.robust_aggregation.RULES:
+            return utils.robust_aggregation.aggregate(self.agg_option, self.model, models, p, self.option['byzantine_ratio'])
         elif self.agg_option == 'weighted_com':
             w = fmodule._model_sum([model_k * pk for model_k, pk in zip(models, p)])
             return (1.0-sum(p))*self.model + w
@@ -225,18 +320,54 @@ class BasicServer:
             p = [pk/sump for pk in p]
             return fmodule._model_sum([model_k * pk for model_k, pk in zip(models, p)])
 
-    def test_on_clients(self, round, dataflag='valid'):
+    def aggregate_masked(self, masked_models, p=[]):
+        """
+        Aggregate the masked models of the clients as self.aggregate() does, where the server only
+        obtains the sum Σpk * model_k of the surviving clients after the masks are cancelled out.
+        :param
+            masked_models: a list of utils.secure_aggregation.MaskedVector
+            p: a list of weights for aggregating
+        :return
+            the averaged result
+        """
+        # a client that is sampled more than once uploads its masked model once, weighted by all its draws,
+        # so that its draws are counted as self.aggregate() counts the repeated models (they survive or drop together)
+        masked_models = list({mv.cid: mv for mv in masked_models}.values())
+        pk = dict(zip(self.selected_clients, p))
+        draws = self.secure_aggregation.draws
+        p = [pk[mv.cid] for mv in masked_models for _ in range(draws[mv.cid])]
+        K = len(p)
+        w = torch.nn.utils.parameters_to_vector(self.model.parameters()).detach()
+        s = torch.tensor(self.secure_aggregation.unmask_sum(masked_models), dtype=w.dtype, device=w.device)
+        if self.agg_option == 'weighted_scale':
+            w = s * self.num_clients / K
+        elif self.agg_option == 'uniform':
+            w = s / K
+        elif self.agg_option == 'weighted_com':
+            w = (1.0 - sum(p)) * w + s
+        else:
+            w = s / sum(p)
+        new_model = copy.deepcopy(self.model)
+        torch.nn.utils.vector_to_parameters(w, new_model.parameters())
+        stats = self.secure_aggregation.stats[-1]
+        print("Secure Aggregation: {} clients ({} dropped), client time {:.4f}s, server time {:.4f}s, upload {:.2f}MB ({:.2f}x)".format(
+            stats['clients'], stats['dropped'], stats['client_time'], stats['server_time'], stats['upload_bytes'] / 2 ** 20, 1.0 * stats['upload_bytes'] / max(stats['plain_upload_bytes'], 1)))
+        return new_model
+
+    def test_on_clients(self, round, dataflag='valid', model=None):
         """
         Validate accuracies and losses on clients' local datasets
         :param
             round: the current communication round
             dataflag: choose train data or valid data to evaluate
+            model: the model need to be evaluated, and self.model is evaluated if it's None
         :return
             metrics: a dict contains the lists of each metric_value of the clients
         """
+        if model==None: model=self.model
         all_metrics = collections.defaultdict(list)
         for c in self.clients:
-            client_metrics = c.test(self.model, dataflag)
+            client_metrics = c.test(model, dataflag)
             for met_name, met_val in client_metrics.items():
                 all_metrics[met_name].append(met_val)
         return all_metrics
@@ -255,10 +386,20 @@ class BasicServer:
         else:
             return None
 
+    def snapshot(self):
+        """
+        Copy the model to be evaluated, so that it can be evaluated in the background while the
+        global model keeps training.
+        :return
+            a copy of self.model
+        """
+        return copy.deepcopy(self.model)
+
     def wait_for_accessibility(self, selected_clients):
-        # always waiting for the selected clients to be active during sampling
+        # always waiting for the selected clients to be active during sampling, except those found active by self.is_available()
+        # when sampling among the available clients
         time = 0
-        clients_ensured = set()
+        clients_ensured = set([cid for cid in selected_clients if cid in getattr(self, 'available_clients', set())])
         while True:
             current_active_clients = [cid for cid in selected_clients if self.clients[cid].is_active()]
             clients_ensured = clients_ensured.union(current_active_clients)
@@ -287,6 +428,10 @@ class BasicClient():
         self.epochs = option['num_epochs']
         self.num_steps = option['num_steps'] if option['num_steps']>0 else self.epochs * math.ceil(len(self.train_data)/self.batch_size)
         self.model = None
+        # differential privacy (DP-SGD) of local training, which is only applied by the standard local training
+        if option['dp'] and type(self).train is not BasicClient.train:
+            raise RuntimeError("DP-SGD only supports the algorithms with the standard local training BasicClient.train().")
+        self.privacy = utils.privacy.DPSGD(self.calculator, option['dp_noise_multiplier'], option['dp_max_grad_norm'], min(1.0 * self.batch_size / len(self.train_data), 1.0)) if option['dp'] else None
         # system setting
         self.network_active_rate = 1
         self.network_drop_rate = 0
@@ -307,9 +452,13 @@ class BasicClient():
             # get a batch of data
             batch_data = self.get_batch_data()
             model.zero_grad()
-            # calculate the loss of the model on batched dataset through task-specified calculator
-            loss = self.calculator.train(model, batch_data)
-            loss.backward()
+            if self.privacy is not None:
+                # the clipped and noised per-sample gradients are written into the gradients of the model
+                self.privacy.compute_grads(model, batch_data)
+            else:
+                # calculate the loss of the model on batched dataset through task-specified calculator
+                loss = self.calculator.train(model, batch_data)
+                loss.backward()
             optimizer.step()
         return
 
@@ -334,6 +483,7 @@ class BasicClient():
             the unpacked information that can be rewritten
         """
         # unpack the received package
+        self.secagg_context = received_pkg.get('secagg')
         return received_pkg['model']
 
     def reply(self, svr_pkg):
@@ -363,6 +513,9 @@ class BasicClient():
         :return
             package: a dict that contains the necessary information for the server
         """
+        if getattr(self, 'secagg_context', None) is not None:
+            # upload the weighted and masked parameters instead of the model
+            model = self.secagg_context['aggregation'].mask(self.secagg_context, model)
         return {
             "model" : model,
         }
@@ -435,10 +588,17 @@ class BasicClient():
             a batch of data
         """
         if not self.data_loader:
-            self.data_loader = iter(self.calculator.get_data_loader(self.train_data, batch_size=self.batch_size))
+            self.data_loader = self.calculator.get_batch_iterator(self.train_data, batch_size=self.batch_size)
         try:
             batch_data = next(self.data_loader)
         except StopIteration:
-            self.data_loader = iter(self.calculator.get_data_loader(self.train_data, batch_size=self.batch_size))
+            self.data_loader = self.calculator.get_batch_iterator(self.train_data, batch_size=self.batch_size)
             batch_data = next(self.data_loader)
-        return batch_data
\ No newline at end of file
+        return batch_data
+
+    def release_data(self):
+        """
+        Release the batches that are prefetched on the device by the iterator of the local data, which is
+        called after the local training so that the idle clients hold no memory of the device
+        """
+        if hasattr(self.data_loader, 'release'): self.data_loader.release()
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+Hierarchical FedAvg with two tiers of aggregation (cloud - edge - client). The clients are assigned to
+num_edges edge aggregators (client k belongs to the edge k % num_edges). In each round, each edge starts
+from the global model and trains its selected clients for edge_rounds edge rounds, where the model of the
+next edge round is the average Σ(pk/Σpk) * model_k of its clients. After the last edge round, each edge
+forwards a single partial sum [Σpk * model_k, Σpk, K_e] to the cloud, which only aggregates num_edges partial
+sums into the global model as BasicServer.aggregate() does with the option aggregate:
+    weighted_scale: N/K * Σpk * model_k, uniform: 1/K * Σmodel_k, weighted_com: (1-Σpk) * w_old + Σpk * model_k,
+    other: Σ(pk/Σpk) * model_k
+so that the fan-in of the cloud is bounded by num_edges, and each edge keeps a running sum instead of the
+models of all its clients. With num_edge_workers > 1, the edges of a round are run by a pool of processes
+forked from the server once (CPU only, since CUDA can't be used in forked processes), where each task carries
+the global model and the learning rate of the round, and each worker is reseeded by (seed, round, edge).
+The network simulation of BasicServer.communicate is not applied to the edges.
+"""
+from .fedbase import BasicServer, BasicClient
+from utils import fmodule
+import copy
+import multiprocessing
+import numpy as np
+import torch
+import utils.robust_aggregation
+
+# the server shared by the edge workers forked from it
+_SERVER = None
+
+def _run_edge(args):
+    edge_id, client_ids, round, model, lr = args
+    seed = (_SERVER.option['seed'] * 1000003 + round * 1009 + edge_id) % (2 ** 31)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    # the clients of the forked server keep the learning rate of the round when the pool was created
+    for cid in client_ids: _SERVER.clients[cid].set_learning_rate(lr)
+    return _SERVER.edge_iterate(edge_id, client_ids, model)
+
+class Server(BasicServer):
+    def __init__(self, option, model, clients, test_data = None):
+        super(Server, self).__init__(option, model, clients, test_data)
+        self.paras_name = ['num_edges', 'edge_rounds']
+        if option['edge_rounds'] < 1:
+            raise RuntimeError("The number of edge rounds should be at least 1.")
+        if self.agg_option in utils.robust_aggregation.RULES:
+            raise RuntimeError("The edges of hierarchical only forward the weighted sums of the models, which can't be aggregated by {}.".format(self.agg_option))
+        self.num_edges = max(min(option['num_edges'], self.num_clients), 1)
+        self.edge_rounds = option['edge_rounds']
+        self.num_edge_workers = option['num_edge_workers']
+        self.edges = [[cid for cid in range(self.num_clients) if cid % self.num_edges == e] for e in range(self.num_edges)]
+        self.pool = None
+
+    def run(self):
+        try:
+            super(Server, self).run()
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+
+    def get_pool(self):
+        """Fork the pool of the edge workers once, which is reused by all the rounds"""
+        if self.pool is None:
+            global _SERVER
+            _SERVER = self
+            self.pool = multiprocessing.get_context('fork').Pool(min(self.num_edge_workers, self.num_edges))
+            _SERVER = None
+        return self.pool
+
+    def iterate(self, t):
+        self.selected_clients = self.sample()
+        # group the selected clients by their edges
+        edge_clients = [[] for _ in range(self.num_edges)]
+        for cid in self.selected_clients: edge_clients[cid % self.num_edges].append(cid)
+        tasks = [(e, cids) for e, cids in enumerate(edge_clients) if cids]
+        if self.num_edge_workers > 1 and len(tasks) > 1:
+            partial_sums = self.get_pool().map(_run_edge, [(e, cids, t, self.model, self.lr) for e, cids in tasks])
+        else:
+            partial_sums = [self.edge_iterate(e, cids, self.model) for e, cids in tasks]
+        # aggregate the partial sums of the edges
+        partial_sums = [ps for ps in partial_sums if ps[2] > 0]
+        if not partial_sums: return
+        s = fmodule._model_sum([ps for ps, _, _ in partial_sums])
+        sump = sum([sp for _, sp, _ in partial_sums])
+        K = sum([k for _, _, k in partial_sums])
+        if self.agg_option == 'weighted_scale':
+            self.model = s * self.num_clients / K
+        elif self.agg_option == 'uniform':
+            self.model = s / K
+        elif self.agg_option == 'weighted_com':
+            self.model = (1.0 - sump) * self.model + s
+        else:
+            self.model = s / sump
+        return
+
+    def edge_iterate(self, edge_id, client_ids, model):
+        """
+        The edge rounds of an edge aggregator, which trains its clients starting from the model.
+        :param
+            edge_id: the id of the edge
+            client_ids: the ids of the selected clients of the edge
+            model: the global model
+        :return
+            the partial sum Σpk * model_k of the edge (None if no client replies), Σpk and the number of the replies
+        """
+        edge_model = model
+        for _ in range(self.edge_rounds):
+            partial_sum, sump, K = None, 0.0, 0
+            for cid, pk in zip(client_ids, self.aggregation_weights(client_ids)):
+                reply = self.clients[cid].reply({"model": copy.deepcopy(edge_model)})
+                self.clients[cid].release_data()
+                if not reply: continue
+                weighted_model = reply['model'] * pk
+                partial_sum = weighted_model if partial_sum is None else partial_sum + weighted_model
+                sump += pk
+                K += 1
+            if partial_sum is None: return None, 0.0, 0
+            edge_model = partial_sum / sump
+        return partial_sum, sump, K
+
+class Client(BasicClient):
+    def __init__(self, option, name='', train_data=None, valid_data=None):
+        super(Client, self).__init__(option, name, train_data, valid_data)
@@ -32,11 +32,11 @@ class Client(BasicClient):
         model.train()
         optimizer = self.calculator.get_optimizer(self.optimizer_name, model, lr=self.learning_rate, weight_decay=self.weight_decay, momentum=self.momentum)
         for iter in range(self.num_steps):
-            batch_data = self.get_batch_data()
+            # the same augmented batch is used by the loss and the model contrastive loss
+            batch_data = self.calculator.data_to_device(self.get_batch_data(), train=True)
             model.zero_grad()
             loss = self.calculator.train(model, batch_data)
             # calculate model contrastive loss
-            batch_data = self.calculator.data_to_device(batch_data)
             z = model.get_embedding(batch_data[0])
             z_glob = global_model.get_embedding(batch_data[0])
             z_prev = self.local_model.get_embedding(batch_data[0]) if self.local_model else None
@@ -0,0 +1,186 @@
+"""
+Micro-benchmarks of the model arithmetic in utils.fmodule and the aggregation of BasicServer.
+Each operation is timed over a matrix of models (benchmark/*/model) and numbers of clients, and
+its peak memory is recorded as the increase of the allocated CUDA memory (when --gpu is set) or
+of the resident memory of the process (on CPU).
+
+Usage (from the directory easyFL):
+    python bench_fmodule.py
+    python bench_fmodule.py --models mnist_classification.cnn cifar10_classification.resnet18 --num_clients 10 100 --repeat 10 --output bench.json
+"""
+import argparse
+import copy
+import importlib
+import os
+import threading
+import time
+import numpy as np
+import torch
+import ujson
+from prettytable import PrettyTable
+from utils import fmodule
+import utils.robust_aggregation
+from algorithm.fedbase import BasicServer
+
+default_models = [
+    'mnist_classification.mlp',
+    'mnist_classification.cnn',
+    'cifar10_classification.cnn',
+    'cifar100_classification.cnn',
+    'cifar10_classification.resnet18',
+    'shakespeare_classification.stackedlstm',
+]
+agg_list = ['uniform', 'weighted_scale', 'weighted_com', 'normalized'] + utils.robust_aggregation.RULES
+
+def read_option():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', help='models to be benchmarked in the form of benchmark.model;', type=str, nargs='+', default=default_models)
+    parser.add_argument('--num_clients', help='numbers of the models to be summed, averaged and aggregated;', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--repeat', help='the number of timed runs of each operation;', type=int, default=5)
+    parser.add_argument('--warmup', help='the number of untimed runs of each operation;', type=int, default=1)
+    parser.add_argument('--gpu', help='GPU ID, -1 for CPU', type=int, default=-1)
+    parser.add_argument('--seed', help='seed for random initialization;', type=int, default=0)
+    parser.add_argument('--byzantine_ratio', help='the assumed ratio of the malicious clients of the robust aggregation rules;', type=float, default=0.1)
+    parser.add_argument('--output', help='the path of the .json file to save the results, and nothing will be saved if it is empty;', type=str, default='')
+    try: option = vars(parser.parse_args())
+    except IOError as msg: parser.error(str(msg))
+    return option
+
+class MemoryMonitor:
+    """Record the peak memory during a period as the increase from the memory at its beginning."""
+    def __init__(self, device, interval=0.001):
+        self.device = device
+        self.interval = interval
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    def _rss(self):
+        try:
+            with open('/proc/self/statm') as inf:
+                return int(inf.read().split()[1]) * self.page_size
+        except (IOError, OSError, IndexError, ValueError):
+            return 0
+
+    def _poll(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+            torch.cuda.reset_peak_memory_stats(self.device)
+            self.base = torch.cuda.memory_allocated(self.device)
+        else:
+            self.base = self.peak = self._rss()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._poll, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+            self.peak = torch.cuda.max_memory_allocated(self.device)
+        else:
+            self.peak = max(self.peak, self._rss())
+            self._stop.set()
+            self._thread.join()
+        self.usage = max(self.peak - self.base, 0)
+
+def timeit(func, device, repeat=5, warmup=1):
+    """
+    Time func() and record its peak memory.
+    :param
+        func: the operation to be benchmarked
+        device: the device where the operation runs
+        repeat: the number of timed runs
+        warmup: the number of untimed runs before timing
+    :return
+        a dict of the mean, std, min time costs (seconds) and the peak memory (bytes)
+    """
+    def sync():
+        if device.type == 'cuda': torch.cuda.synchronize(device)
+    for _ in range(warmup):
+        func()
+    sync()
+    costs = []
+    peak = 0
+    for _ in range(repeat):
+        with MemoryMonitor(device) as mm:
+            start = time.perf_counter()
+            res = func()
+            sync()
+            costs.append(time.perf_counter() - start)
+            del res
+        peak = max(peak, mm.usage)
+    return {'mean': float(np.mean(costs)), 'std': float(np.std(costs)), 'min': float(np.min(costs)), 'peak_memory': peak}
+
+def create_server(model, num_clients, agg_option, byzantine_ratio=0.1):
+    """Create a server that only holds the attributes used by BasicServer.aggregate"""
+    server = BasicServer.__new__(BasicServer)
+    server.model = model
+    server.num_clients = num_clients
+    server.agg_option = agg_option
+    server.option = {'byzantine_ratio': byzantine_ratio}
+    return server
+
+def bench_model(spec, option, device):
+    bmk_name, model_name = spec.split('.', 1)
+    fmodule.Model = getattr(importlib.import_module('.'.join(['benchmark', bmk_name, 'model', model_name])), 'Model')
+    fmodule.device = device
+    global_model = fmodule.Model().to(device)
+    num_params = sum(p.numel() for p in global_model.parameters())
+    max_clients = max(option['num_clients'])
+    models = [copy.deepcopy(global_model) for _ in range(max_clients)]
+    with torch.no_grad():
+        for m in models:
+            for p in m.parameters(): p.add_(torch.randn_like(p) * 0.01)
+    m1, m2 = models[0], models[1]
+    results = []
+    # operations between two models
+    pairwise_ops = {
+        '_model_add': lambda: fmodule._model_add(m1, m2),
+        '_model_scale': lambda: fmodule._model_scale(m1, 0.5),
+        '_model_norm': lambda: fmodule._model_norm(m1),
+        '_model_dot': lambda: fmodule._model_dot(m1, m2),
+        '_model_cossim': lambda: fmodule._model_cossim(m1, m2),
+    }
+    for op_name, func in pairwise_ops.items():
+        results.append(dict(model=spec, num_params=num_params, op=op_name, num_clients=2, **timeit(func, device, option['repeat'], option['warmup'])))
+    # operations over the models of clients
+    for K in option['num_clients']:
+        ms = models[:K]
+        vols = np.random.randint(10, 1000, size=K)
+        p = list(vols / vols.sum() * K / max_clients)
+        ops = {
+            '_model_sum': lambda: fmodule._model_sum(ms),
+            '_model_average': lambda: fmodule._model_average(ms),
+        }
+        for agg_option in agg_list:
+            server = create_server(global_model, max_clients, agg_option, option['byzantine_ratio'])
+            ops['aggregate(' + agg_option + ')'] = lambda server=server: server.aggregate(ms, p=p)
+        for op_name, func in ops.items():
+            results.append(dict(model=spec, num_params=num_params, op=op_name, num_clients=K, **timeit(func, device, option['repeat'], option['warmup'])))
+    return results
+
+def print_results(results):
+    tb = PrettyTable()
+    tb.field_names = ['model', '#params', 'operation', '#clients', 'mean(ms)', 'std(ms)', 'min(ms)', 'peak memory(MB)']
+    for r in results:
+        tb.add_row([r['model'], r['num_params'], r['op'], r['num_clients'], '{:.3f}'.format(r['mean'] * 1000), '{:.3f}'.format(r['std'] * 1000), '{:.3f}'.format(r['min'] * 1000), '{:.2f}'.format(r['peak_memory'] / 2 ** 20)])
+    print(tb)
+
+if __name__ == '__main__':
+    option = read_option()
+    torch.manual_seed(option['seed'])
+    np.random.seed(option['seed'])
+    device = torch.device('cuda:{}'.format(option['gpu']) if torch.cuda.is_available() and option['gpu'] != -1 else 'cpu')
+    results = []
+    for spec in option['models']:
+        print("benchmarking {}...".format(spec), end='')
+        results.extend(bench_model(spec, option, device))
+        print('done')
+    print_results(results)
+    if option['output']:
+        with open(option['output'], 'w') as outf:
+            ujson.dump({'option': option, 'device': str(device), 'torch': torch.__version__, 'results': results}, outf)
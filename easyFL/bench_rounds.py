@@ -0,0 +1,197 @@
+"""
+End-to-end throughput benchmark of the federated algorithms on the offline synthetic tasks.
+The tasks of synthetic_classification and distributed_quadratic_programming are generated locally
+at the specified scale, and then each algorithm in ./algorithm is run for a fixed number of rounds with
+evaluation on (every round) and off. Each run is executed in a new process, where
+    rounds/sec:         (num_rounds + 1) / the time cost of server.run()
+    client-steps/sec:   the number of batches consumed by the local training of all the clients / the time cost of server.run()
+    eval share:         the time cost of the evaluation ('Eval Time Cost' of the logger) / the time cost of server.run()
+    peak RSS:           the maximum resident set size of the process (including reading the task)
+are measured. The runs are not traced unless --trace is set, so that the throughput doesn't include the overhead
+of recording the spans, and the traced runs are only meant for the breakdown of the phases saved in their records. An algorithm that fails on a task is reported with its error instead of aborting the benchmark.
+
+Usage (from the directory easyFL):
+    python bench_rounds.py --num_clients 100 --dimension 60 --minvol 10 --num_rounds 5 --output bench_rounds.csv
+"""
+import argparse
+import contextlib
+import csv
+import functools
+import importlib
+import multiprocessing
+import os
+import queue as queue_module
+import shutil
+import sys
+import tempfile
+import time
+import resource
+import ujson
+from prettytable import PrettyTable
+
+EASYFL_DIR = os.path.dirname(os.path.abspath(__file__))
+if EASYFL_DIR not in sys.path: sys.path.insert(0, EASYFL_DIR)
+
+# benchmark: (model, dist_id, skewness, the name of the argument of Model that specifies the dimension)
+bmk_config = {
+    'synthetic_classification': ('lr', 0, 0, 'dim_in'),
+    'distributed_quadratic_programming': ('vec', 5, 0.5, 'dim_in'),
+}
+fields = ['benchmark', 'algorithm', 'eval', 'status', 'rounds', 'run_time', 'rounds_per_sec', 'client_steps', 'client_steps_per_sec', 'eval_time', 'eval_share', 'peak_rss_mb', 'error']
+
+def read_option():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--benchmarks', help='names of the synthetic benchmarks;', type=str, nargs='+', choices=list(bmk_config.keys()), default=list(bmk_config.keys()))
+    parser.add_argument('--algorithms', help='names of the algorithms, and all the algorithms in ./algorithm will be run as default;', type=str, nargs='+', default=[])
+    parser.add_argument('--num_clients', help='the number of clients;', type=int, default=30)
+    parser.add_argument('--dimension', help='the dimension of the features (synthetic_classification) or the variables (distributed_quadratic_programming);', type=int, default=60)
+    parser.add_argument('--minvol', help='the minimal volume of local data (each client owns 40*minvol samples in IID synthetic_classification);', type=int, default=10)
+    parser.add_argument('--num_rounds', help='number of communication rounds of each run', type=int, default=5)
+    parser.add_argument('--num_steps', help='the number of local steps', type=int, default=10)
+    parser.add_argument('--batch_size', help='batch size when clients trainset on data;', type=int, default=32)
+    parser.add_argument('--proportion', help='proportion of clients sampled per round', type=float, default=0.2)
+    parser.add_argument('--gpu', help='GPU ID, -1 for CPU', type=int, default=-1)
+    parser.add_argument('--seed', help='seed for random initialization;', type=int, default=0)
+    parser.add_argument('--timeout', help='the maximal seconds of each run', type=int, default=3600)
+    parser.add_argument('--workdir', help='the directory to generate the tasks and save the records, and a temporary directory is used (and removed) as default;', type=str, default='')
+    parser.add_argument('--output', help='the path of the table (.json or .csv) to save the results;', type=str, default='')
+    parser.add_argument('--trace', help='set 1 to trace the phases of each run into its record (which adds the overhead of tracing to the measured throughput);', type=int, default=0)
+    try: option = vars(parser.parse_args())
+    except IOError as msg: parser.error(str(msg))
+    return option
+
+def list_algorithms():
+    return sorted([f[:-3] for f in os.listdir(os.path.join(EASYFL_DIR, 'algorithm')) if f.endswith('.py') and f != 'fedbase.py'])
+
+def generate_task(bmk_name, option):
+    """Generate the task of the benchmark into ./fedtask and return its name"""
+    model, dist_id, skewness, _ = bmk_config[bmk_name]
+    TaskGen = getattr(importlib.import_module('.'.join(['benchmark', bmk_name, 'core'])), 'TaskGen')
+    generator = TaskGen(dist_id=dist_id, skewness=skewness, num_clients=option['num_clients'], dimension=option['dimension'], minvol=option['minvol'])
+    generator.set_random_seed(option['seed'])
+    generator.run()
+    return generator.taskname
+
+def count_client_steps(server):
+    """Count the batches consumed by the clients by wrapping their get_batch_data()"""
+    counter = [0]
+    def counted(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            counter[0] += 1
+            return func(*args, **kwargs)
+        return wrapper
+    for c in server.clients:
+        c.get_batch_data = counted(c.get_batch_data)
+    return counter
+
+def run_algorithm(bmk_name, args, model_kwargs, queue):
+    """Run a single algorithm on the task and put its measurements into queue (executed in a new process)"""
+    res = {}
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            import utils.fflow as flw
+            option = flw.read_option(args)
+            # the models of the benchmarks take the dimension of the task as their arguments
+            model_module = importlib.import_module('.'.join(['benchmark', bmk_name, 'model', option['model']]))
+            model_module.Model = functools.partial(model_module.Model, **model_kwargs)
+            flw.setup_seed(option['seed'])
+            server = flw.initialize(option)
+            steps = count_client_steps(server)
+            start = time.perf_counter()
+            server.run()
+            run_time = time.perf_counter() - start
+            eval_time = sum(flw.logger.time_buf.get('Eval Time Cost', []))
+        res.update({
+            'status': 'ok',
+            'rounds': option['num_rounds'] + 1,
+            'run_time': run_time,
+            'rounds_per_sec': (option['num_rounds'] + 1) / run_time,
+            'client_steps': steps[0],
+            'client_steps_per_sec': steps[0] / run_time,
+            'eval_time': eval_time,
+            'eval_share': eval_time / run_time,
+        })
+    except (Exception, SystemExit) as e:
+        res.update({'status': 'failed', 'error': '{}: {}'.format(type(e).__name__, e)})
+    # ru_maxrss is measured in kilobytes on Linux
+    res['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put(res)
+
+def bench(bmk_name, task, algorithm, eval_on, option):
+    model, _, _, dim_arg = bmk_config[bmk_name]
+    args = [
+        '--task', task,
+        '--algorithm', algorithm,
+        '--model', model,
+        '--num_rounds', str(option['num_rounds']),
+        '--num_steps', str(option['num_steps']),
+        '--batch_size', str(option['batch_size']),
+        '--proportion', str(option['proportion']),
+        '--gpu', str(option['gpu']),
+        '--seed', str(option['seed']),
+        '--eval_interval', '1' if eval_on else '0',
+        '--trace', str(option['trace']),
+    ]
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    p = ctx.Process(target=run_algorithm, args=(bmk_name, args, {dim_arg: option['dimension']}, queue))
+    p.start()
+    res = None
+    deadline = time.time() + option['timeout']
+    while res is None:
+        try:
+            res = queue.get(timeout=1)
+        except queue_module.Empty:
+            if p.is_alive() and time.time() < deadline: continue
+            try:
+                res = queue.get(timeout=1)
+            except queue_module.Empty:
+                res = {'status': 'failed', 'error': 'timeout' if p.is_alive() else 'the process exited with code {} before reporting'.format(p.exitcode)}
+    if p.is_alive(): p.terminate()
+    p.join()
+    res.update({'benchmark': bmk_name, 'algorithm': algorithm, 'eval': int(eval_on)})
+    return {k: res.get(k, '') for k in fields}
+
+def print_results(results):
+    tb = PrettyTable()
+    tb.field_names = fields[:-1]
+    for r in results:
+        tb.add_row([('{:.4f}'.format(r[k]) if isinstance(r[k], float) else r[k]) for k in fields[:-1]])
+    print(tb)
+    for r in results:
+        if r['status'] != 'ok': print("{} on {} (eval={}) failed: {}".format(r['algorithm'], r['benchmark'], r['eval'], r['error']))
+
+def save_results(results, option, filepath):
+    if filepath.endswith('.csv'):
+        with open(filepath, 'w', newline='') as outf:
+            writer = csv.DictWriter(outf, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        with open(filepath, 'w') as outf:
+            ujson.dump({'option': option, 'results': results}, outf)
+
+if __name__ == '__main__':
+    option = read_option()
+    algorithms = option['algorithms'] if option['algorithms'] else list_algorithms()
+    output = os.path.abspath(option['output']) if option['output'] else ''
+    workdir = os.path.abspath(option['workdir']) if option['workdir'] else tempfile.mkdtemp(prefix='easyfl_bench_')
+    if not os.path.exists(os.path.join(workdir, 'fedtask')): os.makedirs(os.path.join(workdir, 'fedtask'))
+    os.chdir(workdir)
+    results = []
+    try:
+        for bmk_name in option['benchmarks']:
+            print("generating {}...".format(bmk_name), end='')
+            task = generate_task(bmk_name, option)
+            print('done')
+            for algorithm in algorithms:
+                for eval_on in [True, False]:
+                    print("running {} on {} (eval={})...".format(algorithm, task, int(eval_on)), end='')
+                    res = bench(bmk_name, task, algorithm, eval_on, option)
+                    results.append(res)
+                    print(res['status'])
+    finally:
+        if not option['workdir']: shutil.rmtree(workdir, ignore_errors=True)
+    print_results(results)
+    if output: save_results(results, option, output)
@@ -1,4 +1,3 @@
-from torchvision import datasets, transforms
 from benchmark.toolkits import ClassificationCalculator, DefaultTaskGen, IDXTaskReader
 from torch.utils.data import DataLoader
 
@@ -31,6 +30,7 @@ class TaskGen(DefaultTaskGen):
         }
 
     def load_data(self):
+        from torchvision import datasets, transforms
         self.train_data = datasets.CIFAR100(self.rawdata_path, train=True, download=True, transform=transforms.Compose([transforms.ToTensor(), transforms.Normalize((0.4914, 0.4822, 0.4465), (0.2023, 0.1994, 0.2010))]))
         self.test_data = datasets.CIFAR100(self.rawdata_path, train=False, download=True, transform=transforms.Compose([transforms.ToTensor(), transforms.Normalize((0.4914, 0.4822, 0.4465), (0.2023, 0.1994, 0.2010))]))
 
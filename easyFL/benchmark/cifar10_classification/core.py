@@ -1,6 +1,7 @@
-import torchvision.datasets
-from torchvision import datasets, transforms
-from benchmark.toolkits import ClassificationCalculator, DefaultTaskGen, IDXTaskReader
+import torch
+from benchmark.toolkits import ClassificationCalculator, DefaultTaskGen, IDXTaskReader, IDXDataset
+# the pipeline of the X-ray images is shared with the Flower clients
+from benchmark.xray import XRayStore, augment_batch
 
 class TaskGen(DefaultTaskGen):
     def __init__(self, dist_id, num_clients = 1, skewness = 0.5):
@@ -13,31 +14,47 @@ class TaskGen(DefaultTaskGen):
         self.num_classes = 2
         self.save_data = self.IDXData_to_json
         self.visualize = self.visualize_by_class
+        # the images are decoded and resized once into uint8 stores (Resize(256) for training and Resize(224) for testing),
+        # and the rotation, crop and normalization are applied on the batches by TaskCalculator
         self.datasrc = {
-            'class_path': 'torchvision.datasets',
-            'class_name': 'ImageFolder',
+            'class_path': 'benchmark.xray',
+            'class_name': 'XRayStore',
             'train_args': {
                 'root': '"./benchmark/mine/pneumonia/train"',
-                'transform': 'transforms.Compose([transforms.ToTensor()])'  # je feed les données déjà préprocess ici pour gagner du temps mais on peut appliquer le préprocess ici aussi
+                'size': '256'
             },
             'test_args': {
                 'root': '"./benchmark/mine/pneumonia/test"',
-                'transform': 'transforms.Compose([transforms.ToTensor()])' # pareil
+                'size': '224'
             }
         }
 
 
     def load_data(self):
-        self.train_data = datasets.ImageFolder(root='./benchmark/mine/pneumonia/train',
-                                               transform=transforms.Compose([transforms.ToTensor()])) # pareil
-        self.test_data = datasets.ImageFolder(root='./benchmark/mine/pneumonia/test',
-                                              transform=transforms.Compose([transforms.ToTensor()])) # pareil
+        self.train_data = XRayStore(root='./benchmark/mine/pneumonia/train', size=256)
+        self.test_data = XRayStore(root='./benchmark/mine/pneumonia/test', size=224)
 
 
 class TaskReader(IDXTaskReader):
     def __init__(self, taskpath=''):
         super(TaskReader, self).__init__(taskpath)
 
+    def read_data(self):
+        res = super(TaskReader, self).read_data()
+        # the tasks generated before the store was moved into benchmark/ keep class_path 'flower_common.xray'
+        IDXDataset.SET_ORIGIN_BUILDER('CLASS', lambda: XRayStore)
+        return res
+
 class TaskCalculator(ClassificationCalculator):
     def __init__(self, device):
         super(TaskCalculator, self).__init__(device)
+
+    def train(self, model, data):
+        images, labels = self.data_to_device(data, train=True)
+        return self.lossfunc(self.forward(model, images), labels)
+
+    def data_to_device(self, data, train=False):
+        # the batches for training are randomly rotated (+-3), and all the batches are center cropped and normalized
+        # on the whole batch (the collated batches for testing are already transformed)
+        images, labels = super(TaskCalculator, self).data_to_device(data)
+        return (augment_batch(images, train=train) if images.dtype == torch.uint8 else images), labels
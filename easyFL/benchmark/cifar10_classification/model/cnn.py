@@ -1,6 +1,5 @@
 from torch import nn
 from utils.fmodule import FModule
-import torchvision.models as models
 
 class Model(FModule):
 
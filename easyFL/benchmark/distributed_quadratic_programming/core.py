@@ -62,27 +62,41 @@ class TaskCalculator(BasicTaskCalculator):
         super(TaskCalculator, self).__init__(device)
 
     def train(self, model, data):
-        tdata = self.data_to_device(data)
-        outputs = model(tdata)
+        tdata = self.data_to_device(data, train=True)
+        outputs = self.forward(model, tdata)
         loss = 0.5 * torch.mean(outputs)
         return loss
 
+    def functional_loss(self, model, params, data, mask):
+        outputs = torch.func.functional_call(model, params, (data,))
+        return 0.5 * torch.sum(outputs * mask) / torch.sum(mask)
+
     @torch.no_grad()
     def get_evaluation(self, model, data):
         tdata = self.data_to_device(data)
-        outputs = model(tdata)
+        outputs = self.forward(model, tdata)
         loss = 0.5 * torch.mean(outputs)
         return loss.item()
 
     @torch.no_grad()
-    def test(self, model, data):
-        tdata = self.data_to_device(data)
-        outputs = model(tdata)
-        loss = 0.5 * torch.mean(outputs)
-        return loss.item(), loss.item()
+    def test(self, model, dataset, batch_size=64):
+        """
+        Metric = [mean_loss]
+        :param model:
+        :param dataset:
+        :param batch_size:
+        :return: [mean_loss]
+        """
+        model.eval()
+        data_loader = self.get_test_batches(dataset, batch_size=batch_size, shuffle=False)
+        total_loss = 0.0
+        for batch_data in data_loader:
+            outputs = self.forward(model, self.data_to_device(batch_data))
+            total_loss += 0.5 * torch.sum(outputs).item()
+        return {'loss': total_loss/len(dataset)}
 
-    def data_to_device(self, data):
-        return data.to(self.device)
+    def data_to_device(self, data, train=False):
+        return data.to(self.device, non_blocking=True)
 
     def get_data_loader(self, dataset, batch_size=64, shuffle=True):
-        return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle)
+        return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=self._LOADER['num_workers'], pin_memory=self._LOADER['pin_memory'] and torch.cuda.is_available())
@@ -1,4 +1,3 @@
-from torchvision import datasets, transforms
 from benchmark.toolkits import ClassificationCalculator, DefaultTaskGen, IDXTaskReader
 import numpy as np
 
@@ -32,6 +31,7 @@ class TaskGen(DefaultTaskGen):
         }
 
     def load_data(self):
+        from torchvision import datasets, transforms
         self.train_data = datasets.EMNIST(self.rawdata_path, split='byclass', train=True, download=True, transform=transforms.Compose([transforms.ToTensor()]))
         self.test_data = datasets.EMNIST(self.rawdata_path, split='byclass', train=False, download=True, transform=transforms.Compose([transforms.ToTensor()]))
 
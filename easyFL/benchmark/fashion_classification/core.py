@@ -1,4 +1,3 @@
-from torchvision import datasets, transforms
 from benchmark.toolkits import ClassificationCalculator, DefaultTaskGen, XYTaskReader, XYDataset
 
 class TaskGen(DefaultTaskGen):
@@ -15,6 +14,7 @@ class TaskGen(DefaultTaskGen):
         self.label_dict = {0: 'T-shirt', 1: 'Trouser', 2: 'pullover', 3: 'Dress', 4: 'Coat', 5: 'Sandal', 6: 'shirt', 7: 'Sneaker', 8: 'Bag', 9: 'Abkle boot'}
 
     def load_data(self):
+        from torchvision import datasets, transforms
         lb_convert = {}
         for i in range(len(self.selected_labels)):
             lb_convert[self.selected_labels[i]] = i
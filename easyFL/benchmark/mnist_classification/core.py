@@ -1,4 +1,3 @@
-from torchvision import datasets, transforms
 from benchmark.toolkits import ClassificationCalculator, DefaultTaskGen, IDXTaskReader
 
 class TaskGen(DefaultTaskGen):
@@ -29,6 +28,7 @@ class TaskGen(DefaultTaskGen):
         }
 
     def load_data(self):
+        from torchvision import datasets, transforms
         self.train_data = datasets.MNIST(self.rawdata_path, train=True, download=True, transform=transforms.Compose([transforms.ToTensor(), transforms.Normalize((0.1307,), (0.3081,))]))
         self.test_data = datasets.MNIST(self.rawdata_path, train=False, download=True, transform=transforms.Compose([transforms.ToTensor(), transforms.Normalize((0.1307,), (0.3081,))]))
 
@@ -4,7 +4,7 @@ from benchmark.toolkits import DefaultTaskGen, TupleDataset
 import collections
 import re
 import os
-from benchmark.toolkits import  XYTaskReader, ClassificationCalculator
+from benchmark.toolkits import  SEQTaskReader, XYTaskReader, ClassificationCalculator
 import numpy as np
 import os.path
 import ujson
@@ -41,7 +41,13 @@ class TaskGen(DefaultTaskGen):
         self.ALL_LETTERS = "\n !\"&'(),-.0123456789:;>?ABCDEFGHIJKLMNOPQRSTUVWXYZ[]abcdefghijklmnopqrstuvwxyz}"
         self.NUM_LETTERS = len(self.ALL_LETTERS)
         self.SEQ_LENGTH = 80
-        self.save_data = self.XYData_to_json
+        # the lookup table from the bytes of the text to the indices of letters, where the characters not in
+        # ALL_LETTERS are encoded as the space instead of the -1 of ALL_LETTERS.find() (which isn't a valid index
+        # of the embedding), and the characters out of latin-1 are replaced by '?' before encoding
+        self.ENCODING_TABLE = np.full(256, self.ALL_LETTERS.find(' '), dtype=np.uint8)
+        for i, c in enumerate(self.ALL_LETTERS):
+            self.ENCODING_TABLE[ord(c)] = i
+        self.save_data = self.SEQData_to_npz
 
     def load_data(self):
         # download, read the raw dataset and store it as .json
@@ -75,51 +81,53 @@ class TaskGen(DefaultTaskGen):
         all_users = [user for user in all_data.keys()]
 
         train_users = []
-        trainXs = []
+        train_texts = []
+        train_starts = []
         trainYs = []
         client_ids = []
+        num_chars = 0
         cid = 0
         while (len(train_users) < self.num_clients):
             user = np.random.choice(all_users)
             if user in train_users: continue
             examples = all_data[user]['sound_bites']
             play = all_data[user]['play']
-            trainX, trainY = self.example_to_text(examples)
-            trainX = self.X_text_to_vec(trainX)
-            trainY = self.Y_text_to_vec(trainY)
             l = len(examples)
             if l-max(int(l * 0.2), 1) < self.minvol:
                 continue
             else:
+                text = self.text_to_vec(self.example_to_text(examples))
+                num_windows = max(len(text) - self.SEQ_LENGTH, 0)
                 train_users.append(user)
-                client_ids.extend([cid for _ in range(l)])
+                train_texts.append(text)
+                train_starts.append(np.arange(num_windows, dtype=np.int64) + num_chars)
+                trainYs.append(text[self.SEQ_LENGTH:])
+                client_ids.append(np.full(num_windows, cid, dtype=np.int64))
+                num_chars += len(text)
                 cid+=1
-                trainXs.extend(trainX)
-                trainYs.extend(trainY)
-        self.train_data = TupleDataset(trainXs, client_ids, trainYs)
+        # the windows of the users are (start, client id, next character) over the concatenated text
+        self.train_text = np.concatenate(train_texts)
+        self.train_data = TupleDataset(np.concatenate(train_starts), np.concatenate(client_ids), np.concatenate(trainYs).astype(np.int64))
         test_users = []
         all_users = list(set(all_users) - set(train_users))
         num_test = min(max(int(0.2 * len(train_users)), 10), len(all_users))
-        test_dict = {'x':[], 'y':[]}
+        test_texts = []
+        test_starts = []
+        num_chars = 0
         while (len(test_users) < num_test and all_users):
             user = np.random.choice(all_users)
             if user in test_users: continue
             test_users.append(user)
             test_examples = all_data[user]['sound_bites']
             play = all_data[user]['play']
-            testX, testY = self.example_to_text(test_examples)
-            test_dict['x'].extend(self.X_text_to_vec(testX))
-            test_dict['y'].extend(self.Y_text_to_vec(testY))
-        self.test_data = test_dict
+            text = self.text_to_vec(self.example_to_text(test_examples))
+            test_texts.append(text)
+            test_starts.append(np.arange(max(len(text) - self.SEQ_LENGTH, 0), dtype=np.int64) + num_chars)
+            num_chars += len(text)
+        self.test_text = np.concatenate(test_texts) if test_texts else np.zeros(0, dtype=np.uint8)
+        self.test_data = np.concatenate(test_starts) if test_starts else np.zeros(0, dtype=np.int64)
         return
 
-    def convert_data_for_saving(self):
-        xs, _, ys = self.train_data.tolist()
-        self.train_data = {
-            'x': xs,
-            'y': ys
-        }
-
     def _split_into_plays(self, shakespeare_full):
         """Splits the full data by play."""
         # List of tuples (play_name, dict from character to list of lines)
@@ -220,27 +228,26 @@ class TaskGen(DefaultTaskGen):
         return users_and_plays, all_examples, skipped_characters
 
     def example_to_text(self, examples):
+        """Join the sound bites into the text, whose windows of length SEQ_LENGTH are the samples"""
         text = ' '.join(examples)
-        text = re.sub(r"   *", r' ', text)
-        X = []
-        Y = []
-        for i in range(0, len(text) - self.SEQ_LENGTH, 1):
-            seq_in = text[i:i + self.SEQ_LENGTH]
-            seq_out = text[i + self.SEQ_LENGTH]
-            X.append(seq_in)
-            Y.append(seq_out)
-        return X, Y
-
-    def X_text_to_vec(self, X):
-        return [[self.ALL_LETTERS.find(c) for c in word] for word in X]
-
-    def Y_text_to_vec(self, Y):
-        return [self.ALL_LETTERS.find(c) for c in Y]
-
-class TaskReader(XYTaskReader):
+        return re.sub(r"   *", r' ', text)
+
+    def text_to_vec(self, text):
+        """Encode the text into an uint8 array of the indices in ALL_LETTERS by the lookup table"""
+        return self.ENCODING_TABLE[np.frombuffer(text.encode('latin-1', errors='replace'), dtype=np.uint8)]
+
+class TaskReader(SEQTaskReader):
     def __init__(self, taskpath=''):
         super(TaskReader, self).__init__(taskpath)
 
+    def read_data(self):
+        # the tasks generated before the SEQ format keep their windows in data.json ('store': 'XY')
+        with open(os.path.join(self.taskpath, 'data.json'), 'r') as inf:
+            store = ujson.load(inf).get('store')
+        if store == 'XY':
+            return XYTaskReader.read_data(self)
+        return super(TaskReader, self).read_data()
+
 class TaskCalculator(ClassificationCalculator):
     def __init__(self, device):
         super(TaskCalculator, self).__init__(device)
@@ -39,8 +39,7 @@ The details of this dataset is described as below:
     (dist_id, skewness) in {(6, 0), (10, 0), (10, 0.5), (10, 1.0)} as the orininal setup
     IID or (alpha, beta) in {(0,0), (0.5, 0.5), (1, 1)}.
 """
-from benchmark.toolkits import BasicTaskGen, XYTaskReader, ClassificationCalculator
-from scipy.special import softmax
+from benchmark.toolkits import BasicTaskGen, NPZTaskReader, XYTaskReader, ClassificationCalculator
 import numpy as np
 import os.path
 import ujson
@@ -57,131 +56,102 @@ class TaskGen(BasicTaskGen):
         self.taskname = self.get_taskname()
         self.taskpath = os.path.join(self.task_rootpath, self.taskname)
 
-
     def run(self):
+        """
+        Generate the data client by client and save each local dataset into data/<client_name>.npz, so that
+        the memory is bounded by the data of one client. The last 10% of each local dataset is written into the
+        testing set (dtest_x.npy, dtest_y.npy) that is preallocated on the disk.
+        """
         if not self._check_task_exist():
             self.create_task_directories()
         else:
             print("Task Already Exists.")
             return
-
-        xs, ys = self.gen_data(self.num_clients)
-        x_trains = [di[:int(0.75 * len(di))] for di in xs]
-        y_trains = [di[:int(0.75 * len(di))] for di in ys]
-        x_valids = [di[int(0.75 * len(di)):int(0.90 * len(di))] for di in xs]
-        y_valids = [di[int(0.75 * len(di)):int(0.90 * len(di))] for di in ys]
-        x_tests = [di[int(0.90 * len(di)):] for di in xs]
-        y_tests = [di[int(0.90 * len(di)):] for di in ys]
         self.cnames = self.get_client_names()
-        X_test = []
-        Y_test = []
-        for i in range(len(y_tests)):
-            X_test.extend(x_tests[i])
-            Y_test.extend(y_tests[i])
-        self.test_data = {'x': X_test, 'y': Y_test}
+        data_path = os.path.join(self.taskpath, 'data')
+        os.mkdir(data_path)
+        samples_per_user, client_params = self.gen_distribution(self.num_clients)
+        num_tests = [n - int(0.90 * n) for n in samples_per_user]
+        test_x = np.lib.format.open_memmap(os.path.join(self.taskpath, 'dtest_x.npy'), mode='w+', dtype=np.float32, shape=(sum(num_tests), self.dimension))
+        test_y = np.lib.format.open_memmap(os.path.join(self.taskpath, 'dtest_y.npy'), mode='w+', dtype=np.int64, shape=(sum(num_tests),))
         feddata = {
-            'store': 'XY',
+            'store': 'NPZ',
             'client_names': self.cnames,
-            'dtest': self.test_data
+            'dtest': len(test_y),
         }
+        offset = 0
         for cid in range(self.num_clients):
-            feddata[self.cnames[cid]] = {
-                'dtrain': {
-                    'x': x_trains[cid],
-                    'y': y_trains[cid]
-                },
-                'dvalid': {
-                    'x': x_valids[cid],
-                    'y': y_valids[cid]
-                }
-            }
-
+            n = samples_per_user[cid]
+            X_k, Y_k = self.gen_client_data(n, *client_params(cid))
+            k_train, k_valid = int(0.75 * n), int(0.90 * n)
+            np.savez(os.path.join(data_path, self.cnames[cid] + '.npz'), x_train=X_k[:k_train], y_train=Y_k[:k_train], x_valid=X_k[k_train:k_valid], y_valid=Y_k[k_train:k_valid])
+            test_x[offset:offset + n - k_valid] = X_k[k_valid:]
+            test_y[offset:offset + n - k_valid] = Y_k[k_valid:]
+            offset += n - k_valid
+            feddata[self.cnames[cid]] = {'dtrain': k_train, 'dvalid': k_valid - k_train}
+        test_x.flush()
+        test_y.flush()
+        del test_x, test_y
         with open(os.path.join(self.taskpath, 'data.json'), 'w') as outf:
             ujson.dump(feddata, outf)
 
-    def softmax(self, x):
-        ex = np.exp(x)
-        sum_ex = np.sum(np.exp(x))
-        return ex / sum_ex
-
-    def gen_data(self, num_clients):
-        self.dimension = 60
+    def gen_distribution(self, num_clients):
+        """
+        Draw the global variables and the per-client scalars of the distribution.
+        :param
+            num_clients: the number of clients
+        :return
+            samples_per_user: the number of samples of each client
+            client_params: a function cid -> (W_k, b_k, v_k) that draws the local model and the center of features of the client
+        """
         # global variables
         W_global = np.random.normal(0, 1, (self.dimension, self.num_classes))
         b_global = np.random.normal(0, 1, self.num_classes)
         v_global = np.zeros(self.dimension)
-        # create Sigma = Diag([i^(-1.2) for i in range(60)])
-        diagonal = np.zeros(self.dimension)
-        for j in range(self.dimension):
-            diagonal[j] = np.power((j + 1), -1.2)
-        Sigma = np.diag(diagonal)
-        # V
-        V = np.zeros((num_clients, self.dimension))
-
-        if self.dist_id == 0:
-            """I.I.D. && Balance"""
-            W = [W_global for _ in range(num_clients)]
-            b = [b_global for _ in range(num_clients)]
-            for k in range(num_clients): V[k]=v_global
-            samples_per_user = [40 * self.minvol for _ in range(self.num_clients)]
-
-        elif self.dist_id == 5:
-            """Feature skew && Balance"""
-            W = [W_global for _ in range(num_clients)]
-            b = [b_global for _ in range(num_clients)]
-            B = np.random.normal(0, self.skewness, num_clients)
-            for k in range(num_clients): V[k] = np.random.normal(B[k], 1, self.dimension)
-            samples_per_user = [40 * self.minvol for _ in range(self.num_clients)]
-
-        elif self.dist_id == 6:
-            """I.I.D. && Imbalance"""
-            W = [W_global for _ in range(num_clients)]
-            b = [b_global for _ in range(num_clients)]
-            for k in range(num_clients): V[k] = v_global
-            samples_per_user = np.random.lognormal(4, 2, (num_clients)).astype(int) + self.minvol
-
-        elif self.dist_id == 8:
-            """Concept skew && Balance"""
-            Us = np.random.normal(0, self.skewness, num_clients)
-            W = [np.random.normal(Us[k], 1, (self.dimension, self.num_classes)) for k in range(num_clients)]
-            b = [np.random.normal(Us[k], 1, self.num_classes) for k in range(num_clients)]
-            for k in range(num_clients): V[k] = v_global
-            samples_per_user = [40 * self.minvol for _ in range(self.num_clients)]
-        elif self.dist_id == 9:
-            """Concept skew && Feature skew && Balance"""
-            Us = np.random.normal(0, self.skewness, num_clients)
-            W = [np.random.normal(Us[k], 1, (self.dimension, self.num_classes)) for k in range(num_clients)]
-            b = [np.random.normal(Us[k], 1, self.num_classes) for k in range(num_clients)]
-            B = np.random.normal(0, self.skewness, num_clients)
-            for k in range(num_clients): V[k] = np.random.normal(B[k], 1, self.dimension)
-            samples_per_user = [40 * self.minvol for _ in range(self.num_clients)]
-        elif self.dist_id == 10:
-            """Concept skew && Feature skew && Imbalance"""
-            Us = np.random.normal(0, self.skewness, num_clients)
-            W = [np.random.normal(Us[k], 1, (self.dimension, self.num_classes)) for k in range(num_clients)]
-            b = [np.random.normal(Us[k], 1, self.num_classes) for k in range(num_clients)]
-            B = np.random.normal(0, self.skewness, num_clients)
-            for k in range(num_clients): V[k] = np.random.normal(B[k], 1, self.dimension)
-            samples_per_user = np.random.lognormal(4, 2, (num_clients)).astype(int) + self.minvol
-
-        X_split = [[] for _ in range(num_clients)]
-        y_split = [[] for _ in range(num_clients)]
-        for k in range(num_clients):
-            # X_ki~N(v_k, Sigma)
-            X_k = np.random.multivariate_normal(V[k], Sigma, samples_per_user[k])
-            Y_k = np.zeros(samples_per_user[k], dtype=int)
-            for i in range(samples_per_user[k]):
-                # Y_ki = argmax(softmax(W_k x_ki + b_k))
-                tmp = np.dot(X_k[i], W[k]) + b[k]
-                Y_k[i] = np.argmax(softmax(tmp))
-            X_split[k] = X_k.tolist()
-            y_split[k] = Y_k.tolist()
-        return X_split, y_split
-
-class TaskReader(XYTaskReader):
+        concept_skew = self.dist_id in [8, 9, 10]
+        feature_skew = self.dist_id in [5, 9, 10]
+        if self.dist_id not in [0, 5, 6, 8, 9, 10]:
+            raise RuntimeError("Unsupported dist_id {} for synthetic_classification.".format(self.dist_id))
+        # u_k~N(0, alpha) for the local models and B_k~N(0, beta) for the centers of the local features
+        Us = np.random.normal(0, self.skewness, num_clients) if concept_skew else None
+        B = np.random.normal(0, self.skewness, num_clients) if feature_skew else None
+        if self.dist_id in [6, 10]:
+            samples_per_user = (np.random.lognormal(4, 2, (num_clients)).astype(int) + self.minvol).tolist()
+        else:
+            samples_per_user = [40 * self.minvol for _ in range(num_clients)]
+
+        def client_params(cid):
+            W_k = np.random.normal(Us[cid], 1, (self.dimension, self.num_classes)) if concept_skew else W_global
+            b_k = np.random.normal(Us[cid], 1, self.num_classes) if concept_skew else b_global
+            v_k = np.random.normal(B[cid], 1, self.dimension) if feature_skew else v_global
+            return W_k, b_k, v_k
+        return samples_per_user, client_params
+
+    def gen_client_data(self, num_samples, W_k, b_k, v_k):
+        """
+        Generate the local data of a client.
+        :return
+            X_k~N(v_k, Sigma) (float32) and Y_k = argmax(softmax(X_k W_k + b_k)) (int64)
+        """
+        # Sigma = Diag([i^(-1.2) for i in range(dimension)]), so each feature is sampled independently with std i^(-0.6)
+        std = np.power(np.arange(1, self.dimension + 1, dtype=np.float64), -0.6)
+        X_k = v_k + np.random.standard_normal((num_samples, self.dimension)) * std
+        # softmax is monotonic and thus the argmax of the logits is taken directly
+        Y_k = np.argmax(X_k @ W_k + b_k, axis=1).astype(np.int64)
+        return X_k.astype(np.float32), Y_k
+
+class TaskReader(NPZTaskReader):
     def __init__(self, taskpath=''):
         super(TaskReader, self).__init__(taskpath)
 
+    def read_data(self):
+        # the tasks generated before the NPZ format keep their local datasets in data.json ('store': 'XY')
+        with open(os.path.join(self.taskpath, 'data.json'), 'r') as inf:
+            store = ujson.load(inf).get('store')
+        if store == 'XY':
+            return XYTaskReader.read_data(self)
+        return super(TaskReader, self).read_data()
+
 class TaskCalculator(ClassificationCalculator):
     def __init__(self, device):
         super(TaskCalculator, self).__init__(device)
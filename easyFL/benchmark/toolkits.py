@@ -28,7 +28,9 @@ import torch
 ssl._create_default_https_context = ssl._create_unverified_context
 import importlib
 import collections
-from torchvision import datasets, transforms
+import copy
+import functools
+import threading
 
 # ========================================Task Generator============================================
 # This part is for generating federated dataset from original dataset. The generation process should be
@@ -388,6 +390,33 @@ class DefaultTaskGen(BasicTaskGen):
             #ujson.dump(vvv, outf)
         return
 
+    def SEQData_to_npz(self, train_cidxs, valid_cidxs):
+        """
+        Save the sequence tasks whose text is stored only once: self.train_text (self.test_text) is the encoded text
+        of all the training (testing) users as an uint8 array, self.train_data is TupleDataset(window starts, client ids,
+        next characters) and self.test_data is the window starts of the testing text. Each local dataset is saved as
+        the starts of its windows of length self.SEQ_LENGTH into 'data.npz', and 'data.json' contains the meta.
+        """
+        starts = self.train_data.X1.numpy() if isinstance(self.train_data.X1, torch.Tensor) else np.asarray(self.train_data.X1)
+        dtype = np.int32 if len(self.train_text) < np.iinfo(np.int32).max else np.int64
+        arrays = {
+            'text': np.asarray(self.train_text, dtype=np.uint8),
+            'test_text': np.asarray(self.test_text, dtype=np.uint8),
+            'dtest': np.asarray(self.test_data, dtype=dtype),
+        }
+        for cid in range(self.num_clients):
+            arrays[self.cnames[cid] + '_dtrain'] = starts[np.asarray(train_cidxs[cid], dtype=np.int64)].astype(dtype)
+            arrays[self.cnames[cid] + '_dvalid'] = starts[np.asarray(valid_cidxs[cid], dtype=np.int64)].astype(dtype)
+        np.savez_compressed(os.path.join(self.taskpath, 'data.npz'), **arrays)
+        feddata = {
+            'store': 'SEQ',
+            'client_names': self.cnames,
+            'seq_length': self.SEQ_LENGTH,
+        }
+        with open(os.path.join(self.taskpath, 'data.json'), 'w') as outf:
+            ujson.dump(feddata, outf)
+        return
+
     def visualize_by_class(self, train_cidxs):
         import collections
         import matplotlib.pyplot as plt
@@ -433,7 +462,8 @@ class DefaultTaskGen(BasicTaskGen):
 # way of calculation (e.g. loss, evaluating metrics, optimizer) and the format of data (e.g. image, text)
 # can vary in different dataset. Therefore, this module should provide a standard interface for the federated
 # algorithms. To achieve this, we list the necessary interfaces as follows:
-#   1) data_to_device: put the data into cuda device, since different data may differ in size or shape.
+#   1) data_to_device: put the data into cuda device, since different data may differ in size or shape. The batches
+#      for training are passed with train=True, so that the calculators can apply their training transforms.
 #   2) get_data_loader: get the data loader which is enumerable and returns a batch of data
 #   3) get_optimizer: get the optimizer for optimizing the model parameters, which can also vary among different datasets
 #   4) get_loss: the basic loss calculating procedure for the dataset, and returns loss as the final point of the computing graph
@@ -443,13 +473,19 @@ class DefaultTaskGen(BasicTaskGen):
 class BasicTaskCalculator:
 
     _OPTIM = None
+    # the options of the data pipeline of local training, which can be overridden by the TaskCalculator of each task
+    _LOADER = {'num_workers': 0, 'pin_memory': False, 'prefetch': 0}
+    # the compiled forward functions shared by all the calculators in the process (see forward())
+    _COMPILE = False
+    _COMPILED = {}
+    _COMPILE_LOCK = threading.Lock()
 
     def __init__(self, device):
         self.device = device
         self.lossfunc = None
         self.DataLoader = None
 
-    def data_to_device(self, data):
+    def data_to_device(self, data, train=False):
         raise NotImplementedError
 
     def train(self):
@@ -458,9 +494,100 @@ class BasicTaskCalculator:
     def get_evaluation(self):
         raise NotImplementedError
 
+    def functional_loss(self, model, params, data, mask):
+        """
+        The loss of train() computed by torch.func.functional_call(model, params, ...), which enables
+        training many models in lockstep (see utils/functional.py).
+        :param model: the model that provides the architecture
+        :param params: a dict of the parameters of the model
+        :param data: the batch of data returned by data_to_device()
+        :param mask: the weights of the items in the batch (0 for the padded items)
+        :return: the mean loss of the items that are not masked out
+        """
+        raise NotImplementedError
+
     def get_data_loader(self, data, batch_size=64, shuffle=True):
         return NotImplementedError
 
+    def forward(self, model, *inputs):
+        """
+        Compute model(*inputs). When compiling is enabled (see setCompile()), the forward of the model is
+        compiled once for each (model class, training mode, parameter shapes, grad mode, input shapes) in the process,
+        and the parameters and buffers of the model are swapped into the compiled graph by functional_call, so that
+        the new models created by the clients and fmodule in each round reuse the graph instead of compiling again.
+        Since the tracing of torch.compile happens at the first call and isn't thread-safe (e.g. the evaluation in
+        background), the first call of each graph is made under the lock before the graph is shared.
+        :param model: the model to be computed
+        :param inputs: the input tensors of the model
+        :return: the outputs of the model
+        """
+        if not self._COMPILE:
+            return model(*inputs)
+        state = dict(model.named_parameters())
+        state.update(model.named_buffers())
+        key = (type(model), model.training, tuple((n, tuple(t.shape), t.dtype) for n, t in state.items()), torch.is_grad_enabled(), tuple((tuple(x.shape), x.dtype, x.device) for x in inputs))
+        compiled = BasicTaskCalculator._COMPILED.get(key)
+        if compiled is None:
+            with BasicTaskCalculator._COMPILE_LOCK:
+                compiled = BasicTaskCalculator._COMPILED.get(key)
+                if compiled is None:
+                    # the template only provides the architecture (shared by the input shapes), whose own parameters are never used
+                    template = BasicTaskCalculator._COMPILED.setdefault(key[:3], copy.deepcopy(model))
+                    def call(state, inputs):
+                        return torch.func.functional_call(template, state, inputs)
+                    compiled = torch.compile(call, dynamic=False)
+                    # trace the graph by the first call, and share it only once it is compiled
+                    outputs = compiled(state, inputs)
+                    BasicTaskCalculator._COMPILED[key] = compiled
+                    return outputs
+        return compiled(state, inputs)
+
+    def get_batch_iterator(self, dataset, batch_size=64):
+        """
+        Iterate one epoch of the shuffled training batches of the dataset. When self._LOADER['prefetch'] > 0, the
+        next batches are prepared (i.e. gathered, transformed, pinned and copied to self.device) in background
+        while the current batch is computed, and the returned batches are already on self.device.
+        :param dataset: the training dataset
+        :param batch_size: the size of each batch
+        :return: an iterator of the batches
+        """
+        loader = self.get_data_loader(dataset, batch_size=batch_size)
+        if self._LOADER['prefetch'] <= 0:
+            return iter(loader)
+        sampler = getattr(loader, 'sampler', None)
+        # the sampler of the batched datasets is wrapped by a BatchSampler
+        sampler = getattr(sampler, 'sampler', sampler)
+        if sampler is not None and getattr(sampler, 'generator', False) is None:
+            # draw the seed of shuffling here as RandomSampler does, so that the background thread
+            # doesn't consume the global random state concurrently with the training
+            sampler.generator = torch.Generator()
+            sampler.generator.manual_seed(int(torch.empty((), dtype=torch.int64).random_().item()))
+        # the iterator is created here, where the workers of DataLoader (if any) draw their seeds
+        return PrefetchIterator(iter(loader), self.device, depth=self._LOADER['prefetch'], pin_memory=self._LOADER['pin_memory'])
+
+    def get_test_batches(self, dataset, batch_size=64, shuffle=True):
+        """Iterate the batches of the dataset for testing, which are the cached batches if the dataset is a CollatedDataset"""
+        if isinstance(dataset, CollatedDataset):
+            return dataset.batches
+        return self.get_data_loader(dataset, batch_size=batch_size, shuffle=shuffle)
+
+    def collate_dataset(self, dataset, batch_size=64, cache='device'):
+        """
+        Collate the dataset into batches once, so that testing on it only costs the forward passes.
+        :param dataset: the dataset to be collated
+        :param batch_size: the size of each batch
+        :param cache: 'device' to put the batches on self.device, or 'pinned' to keep them in the pinned memory of CPU
+        :return: a CollatedDataset
+        """
+        batches = []
+        for batch_data in self.get_data_loader(dataset, batch_size=batch_size, shuffle=False):
+            if cache == 'device':
+                batch_data = self.data_to_device(batch_data)
+            elif cache == 'pinned' and torch.cuda.is_available():
+                batch_data = [d.pin_memory() for d in batch_data] if isinstance(batch_data, (list, tuple)) else batch_data.pin_memory()
+            batches.append(batch_data)
+        return CollatedDataset(dataset, batches)
+
     def test(self):
         raise NotImplementedError
 
@@ -478,6 +605,28 @@ class BasicTaskCalculator:
     def setOP(cls, OP):
         cls._OPTIM = OP
 
+    @classmethod
+    def setLoader(cls, **options):
+        """
+        Set the options of the data pipeline (num_workers, pin_memory and prefetch) of the calculator, where the
+        options that are not given take the defaults of the calculator (instead of the values set by a previous run
+        in the same process)
+        """
+        # the defaults of the calculator are kept when its options are set for the first time
+        if '_LOADER_DEFAULTS' not in cls.__dict__:
+            cls._LOADER_DEFAULTS = dict(cls._LOADER)
+        for key in options:
+            if key not in cls._LOADER_DEFAULTS:
+                raise RuntimeError("Unknown loader option '{}'.".format(key))
+        cls._LOADER = dict(cls._LOADER_DEFAULTS, **options)
+
+    @classmethod
+    def setCompile(cls, enabled=True):
+        if enabled and not hasattr(torch, 'compile'):
+            print("torch.compile is not available (torch < 2.0), and the models will be run eagerly.")
+            enabled = False
+        cls._COMPILE = enabled
+
 class ClassificationCalculator(BasicTaskCalculator):
     def __init__(self, device):
         super(ClassificationCalculator, self).__init__(device)
@@ -490,11 +639,16 @@ class ClassificationCalculator(BasicTaskCalculator):
         :param data: the training dataset
         :return: loss of the computing graph created by torch
         """
-        tdata = self.data_to_device(data)
-        outputs = model(tdata[0])
+        tdata = self.data_to_device(data, train=True)
+        outputs = self.forward(model, tdata[0])
         loss = self.lossfunc(outputs, tdata[-1])
         return loss
 
+    def functional_loss(self, model, params, data, mask):
+        outputs = torch.func.functional_call(model, params, (data[0],))
+        loss = torch.nn.functional.cross_entropy(outputs, data[-1], reduction='none')
+        return torch.sum(loss * mask) / torch.sum(mask)
+
     @torch.no_grad()
     def test(self, model, dataset, batch_size=64):
         """
@@ -505,12 +659,12 @@ class ClassificationCalculator(BasicTaskCalculator):
         :return: [mean_accuracy, mean_loss]
         """
         model.eval()
-        data_loader = self.get_data_loader(dataset, batch_size=64)
+        data_loader = self.get_test_batches(dataset, batch_size=64)
         total_loss = 0.0
         num_correct = 0
         for batch_id, batch_data in enumerate(data_loader):
             batch_data = self.data_to_device(batch_data)
-            outputs = model(batch_data[0])
+            outputs = self.forward(model, batch_data[0])
             batch_mean_loss = self.lossfunc(outputs, batch_data[-1]).item()
             y_pred = outputs.data.max(1, keepdim=True)[1]
             correct = y_pred.eq(batch_data[-1].data.view_as(y_pred)).long().cpu().sum()
@@ -518,13 +672,123 @@ class ClassificationCalculator(BasicTaskCalculator):
             total_loss += batch_mean_loss * len(batch_data[-1])
         return {'accuracy': 1.0*num_correct/len(dataset), 'loss':total_loss/len(dataset)}
 
-    def data_to_device(self, data):
-        return data[0].to(self.device), data[1].to(self.device)
+    def data_to_device(self, data, train=False):
+        # the copy from pinned memory is asynchronous and ordered before the computation on the same stream
+        return data[0].to(self.device, non_blocking=True), data[1].to(self.device, non_blocking=True)
 
     def get_data_loader(self, dataset, batch_size=64, shuffle=True):
         if self.DataLoader == None:
             raise NotImplementedError("DataLoader Not Found.")
-        return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle)
+        num_workers = self._LOADER['num_workers']
+        pin_memory = self._LOADER['pin_memory'] and torch.cuda.is_available()
+        if getattr(dataset, 'batched', False):
+            # the dataset gathers the whole batch from the list of indices instead of collating the items one by one
+            sampler = torch.utils.data.RandomSampler(dataset) if shuffle else torch.utils.data.SequentialSampler(dataset)
+            batch_sampler = torch.utils.data.BatchSampler(sampler, batch_size=int(batch_size), drop_last=False)
+            return DataLoader(dataset, batch_size=None, sampler=batch_sampler, num_workers=num_workers, pin_memory=pin_memory)
+        return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers, pin_memory=pin_memory)
+
+class PrefetchIterator:
+    """
+    Prepare the next `depth` batches of an iterator in a background thread, where each batch is drawn from the
+    iterator (i.e. the index gather, decoding and transforms of the dataset), pinned and copied to the device
+    by a non-blocking transfer on a side CUDA stream, so that the data path overlaps the computation of the
+    current batch. The prefetched batches are kept until they are consumed, so each iterator holds at most
+    `depth` batches on the device, which are moved back to the host by release() when the iterator becomes idle.
+    """
+    _EXECUTOR = None
+    _LOCK = threading.Lock()
+
+    def __init__(self, batches, device, depth=1, pin_memory=False):
+        """
+        :param batches: the iterator of the batches, each of which is a tensor or a list/tuple of tensors
+        :param device: the device that the batches are copied to
+        :param depth: the number of batches prepared in advance
+        :param pin_memory: whether to pin the batches before copying them to the device
+        """
+        self.batches = batches
+        self.device = torch.device(device)
+        self.depth = max(int(depth), 1)
+        self.stream = torch.cuda.Stream(self.device) if self.device.type == 'cuda' else None
+        self.pin_memory = pin_memory and self.stream is not None
+        self.pending = collections.deque()
+        self.exhausted = False
+        for _ in range(self.depth): self._schedule()
+
+    @classmethod
+    def _executor(cls):
+        # a single thread is shared by all the iterators, which keeps the order of drawing batches deterministic
+        with cls._LOCK:
+            if cls._EXECUTOR is None:
+                import concurrent.futures
+                cls._EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+        return cls._EXECUTOR
+
+    @staticmethod
+    def _apply(batch, func):
+        if isinstance(batch, torch.Tensor): return func(batch)
+        if isinstance(batch, (list, tuple)): return type(batch)([PrefetchIterator._apply(b, func) for b in batch])
+        return batch
+
+    def _schedule(self):
+        if not self.exhausted:
+            self.pending.append(self._executor().submit(self._load))
+
+    def _load(self):
+        try:
+            batch = next(self.batches)
+        except StopIteration:
+            return None
+        if self.stream is None:
+            return batch, None
+        if self.pin_memory:
+            batch = self._apply(batch, lambda t: t if t.is_pinned() else t.pin_memory())
+        with torch.cuda.stream(self.stream):
+            batch = self._apply(batch, lambda t: t.to(self.device, non_blocking=True))
+            event = torch.cuda.Event()
+            event.record(self.stream)
+        return batch, event
+
+    def release(self):
+        """
+        Wait for the batches being prepared and move the prefetched batches back to the host, so that an idle
+        iterator (e.g. of a client between its rounds) holds no memory of the device. The iterator keeps its
+        position, and the moved batches are copied to the device again when they are consumed.
+        """
+        import concurrent.futures
+        released = collections.deque()
+        for future in self.pending:
+            res = future.result()
+            if res is not None and res[1] is not None:
+                res[1].synchronize()
+                res = (self._apply(res[0], lambda t: t.to('cpu')), None)
+            future = concurrent.futures.Future()
+            future.set_result(res)
+            released.append(future)
+        self.pending = released
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.pending:
+            raise StopIteration
+        res = self.pending.popleft().result()
+        if res is None:
+            self.exhausted = True
+            self.pending.clear()
+            raise StopIteration
+        self._schedule()
+        batch, event = res
+        if event is None and self.stream is not None:
+            # the batch was released to the host
+            batch = self._apply(batch, lambda t: t.to(self.device))
+        elif event is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_event(event)
+            # the memory of the batch allocated on the side stream must not be reused before the computation on it
+            self._apply(batch, lambda t: t.record_stream(current_stream))
+        return batch
 
 # =====================================Task Reader\xxDataset======================================================
 # This module is to read the fedtask that is generated by Generator. The target is to load the fedtask into a
@@ -568,13 +832,11 @@ class IDXTaskReader(BasicTaskReader):
     def read_data(self):
         with open(os.path.join(self.taskpath, 'data.json'), 'r') as inf:
             feddata = ujson.load(inf)
-        class_path = feddata['datasrc']['class_path']
-        class_name = feddata['datasrc']['class_name']
-        origin_class = getattr(importlib.import_module(class_path), class_name)
-        IDXDataset.SET_ORIGIN_CLASS(origin_class)
-        origin_train_data = self.args_to_dataset(feddata['datasrc']['train_args'])
-        origin_test_data = self.args_to_dataset(feddata['datasrc']['test_args'])
-        IDXDataset.SET_ORIGIN_DATA(train_data=origin_train_data, test_data=origin_test_data)
+        datasrc = feddata['datasrc']
+        # the origin class and datasets are imported and built when the data is accessed for the first time
+        IDXDataset.SET_ORIGIN_BUILDER('CLASS', lambda: getattr(importlib.import_module(datasrc['class_path']), datasrc['class_name']))
+        IDXDataset.SET_ORIGIN_BUILDER('TRAIN', lambda: self.args_to_dataset(datasrc['train_args']))
+        IDXDataset.SET_ORIGIN_BUILDER('TEST', lambda: self.args_to_dataset(datasrc['test_args']))
 
         test_data = IDXDataset(feddata['dtest'], key='TEST')
         train_datas = [IDXDataset(feddata[name]['dtrain']) for name in feddata['client_names']]
@@ -582,10 +844,45 @@ class IDXTaskReader(BasicTaskReader):
         return train_datas, valid_datas, test_data, feddata['client_names']
 
     def args_to_dataset(self, args):
+        # transforms is used by the arguments of the dataset (e.g. 'transforms.Compose([transforms.ToTensor()])')
+        from torchvision import transforms
         if not isinstance(args, dict):
             raise TypeError
         args_str = '(' +  ','.join([key+'='+value for key,value in args.items()]) + ')'
-        return eval("IDXDataset._ORIGIN_DATA['CLASS']"+args_str)
+        return eval("IDXDataset.GET_ORIGIN_DATA('CLASS')"+args_str)
+
+class SEQTaskReader(BasicTaskReader):
+    def read_data(self):
+        with open(os.path.join(self.taskpath, 'data.json'), 'r') as inf:
+            feddata = ujson.load(inf)
+        seq_length = feddata['seq_length']
+        arrays = np.load(os.path.join(self.taskpath, 'data.npz'))
+        # the text is shared by the local datasets, which only keep the starts of their windows
+        text = torch.from_numpy(arrays['text'])
+        test_data = SlidingWindowDataset(torch.from_numpy(arrays['test_text']), arrays['dtest'], seq_length)
+        train_datas = [SlidingWindowDataset(text, arrays[name + '_dtrain'], seq_length) for name in feddata['client_names']]
+        valid_datas = [SlidingWindowDataset(text, arrays[name + '_dvalid'], seq_length) for name in feddata['client_names']]
+        return train_datas, valid_datas, test_data, feddata['client_names']
+
+class NPZTaskReader(BasicTaskReader):
+    def read_data(self):
+        """Read the tasks whose local datasets are saved in data/<client_name>.npz, which are loaded when they are accessed for the first time"""
+        with open(os.path.join(self.taskpath, 'data.json'), 'r') as inf:
+            feddata = ujson.load(inf)
+        test_data = LazyXYDataset(functools.partial(_load_npy, os.path.join(self.taskpath, 'dtest_x.npy'), os.path.join(self.taskpath, 'dtest_y.npy')), feddata['dtest'])
+        train_datas, valid_datas = [], []
+        for name in feddata['client_names']:
+            filepath = os.path.join(self.taskpath, 'data', name + '.npz')
+            train_datas.append(LazyXYDataset(functools.partial(_load_npz, filepath, 'x_train', 'y_train'), feddata[name]['dtrain']))
+            valid_datas.append(LazyXYDataset(functools.partial(_load_npz, filepath, 'x_valid', 'y_valid'), feddata[name]['dvalid']))
+        return train_datas, valid_datas, test_data, feddata['client_names']
+
+def _load_npz(filepath, x_key, y_key):
+    with np.load(filepath) as f:
+        return f[x_key], f[y_key]
+
+def _load_npy(x_path, y_path):
+    return np.load(x_path), np.load(y_path)
 
 class XTaskReader(BasicTaskReader):
     def read_data(self):
@@ -602,43 +899,67 @@ class XYDataset(Dataset):
         XYDataset transforms data that is list\array into tensor.
         The data is already loaded into memory before passing into XYDataset.__init__()
         and thus is only suitable for benchmarks with small size (e.g. CIFAR10, MNIST)
+        The conversion into tensor is deferred until the data is accessed for the first time,
+        so that the clients that are never sampled don't pay for it.
         Args:
             X: a list of features
             Y: a list of labels with the same length of X
         """
         if not self._check_equal_length(X, Y):
             raise RuntimeError("Different length of Y with X.")
-        if totensor:
-            try:
-                self.X = torch.tensor(X)
-                self.Y = torch.tensor(Y)
-            except:
-                raise RuntimeError("Failed to convert input into torch.Tensor.")
-        else:
-            self.X = X
-            self.Y = Y
-        self.all_labels = list(set(self.tolist()[1]))
+        self._X = X
+        self._Y = Y
+        self._lazy = totensor
+        self._all_labels = None
+
+    def _to_tensor(self):
+        try:
+            self._X = torch.tensor(self._X)
+            self._Y = torch.tensor(self._Y)
+        except:
+            raise RuntimeError("Failed to convert input into torch.Tensor.")
+        self._lazy = False
+
+    @property
+    def X(self):
+        if self._lazy: self._to_tensor()
+        return self._X
+
+    @property
+    def Y(self):
+        if self._lazy: self._to_tensor()
+        return self._Y
 
     def __len__(self):
-        return len(self.Y)
+        return len(self._Y)
 
     def __getitem__(self, item):
-        return self.X[item], self.Y[item]
+        if self._lazy: self._to_tensor()
+        return self._X[item], self._Y[item]
 
     def tolist(self):
-        if not isinstance(self.X, torch.Tensor):
-            return self.X, self.Y
-        return self.X.tolist(), self.Y.tolist()
+        if not isinstance(self._X, torch.Tensor):
+            return self._X, self._Y
+        return self._X.tolist(), self._Y.tolist()
 
     def _check_equal_length(self, X, Y):
         return len(X)==len(Y)
 
+    @property
+    def all_labels(self):
+        if self._all_labels is None:
+            self._all_labels = list(set(self._Y.tolist() if isinstance(self._Y, torch.Tensor) else self._Y))
+        return self._all_labels
+
     def get_all_labels(self):
         return self.all_labels
 
 class IDXDataset(Dataset):
     # The source dataset that can be indexed by IDXDataset
     _ORIGIN_DATA = {'TRAIN': None, 'TEST': None, 'CLASS':None}
+    # The functions that build the source dataset when it is accessed for the first time
+    _ORIGIN_BUILDER = {}
+    _LOCK = threading.Lock()
 
     def __init__(self, idxs, key='TRAIN'):
         """Init dataset with 'src_data' and a list of indexes that are used to position data in 'src_data'"""
@@ -649,13 +970,33 @@ class IDXDataset(Dataset):
 
     @classmethod
     def SET_ORIGIN_DATA(cls, train_data=None, test_data=None):
+        cls._ORIGIN_BUILDER.pop('TRAIN', None)
+        cls._ORIGIN_BUILDER.pop('TEST', None)
         cls._ORIGIN_DATA['TRAIN'] = train_data
         cls._ORIGIN_DATA['TEST'] = test_data
 
     @classmethod
     def SET_ORIGIN_CLASS(cls, DataClass = None):
+        cls._ORIGIN_BUILDER.pop('CLASS', None)
         cls._ORIGIN_DATA['CLASS'] = DataClass
 
+    @classmethod
+    def SET_ORIGIN_BUILDER(cls, key, builder=None):
+        """Set the function builder() that returns the source data of 'key' when it is accessed for the first time"""
+        if key==None:
+            raise RuntimeError("Empty key when calling class algorithm IDXData.SET_ORIGIN_BUILDER")
+        cls._ORIGIN_DATA[key] = None
+        cls._ORIGIN_BUILDER[key] = builder
+
+    @classmethod
+    def GET_ORIGIN_DATA(cls, key):
+        """Get the source data of 'key', which is built by its builder if it hasn't been built"""
+        if cls._ORIGIN_DATA.get(key) is None and key in cls._ORIGIN_BUILDER:
+            with cls._LOCK:
+                if cls._ORIGIN_DATA.get(key) is None and key in cls._ORIGIN_BUILDER:
+                    cls._ORIGIN_DATA[key] = cls._ORIGIN_BUILDER.pop(key)()
+        return cls._ORIGIN_DATA[key]
+
     @classmethod
     def ADD_KEY_TO_DATA(cls, key, value = None):
         if key==None:
@@ -664,11 +1005,111 @@ class IDXDataset(Dataset):
 
     def __getitem__(self, item):
         idx = self.idxs[item]
-        return self._ORIGIN_DATA[self.key][idx]
+        return self.GET_ORIGIN_DATA(self.key)[idx]
 
     def __len__(self):
         return len(self.idxs)
 
+class LazyXYDataset(Dataset):
+    def __init__(self, loader, length):
+        """The pairs of features and labels that are loaded by loader() -> (X, Y) (numpy arrays) when the data is
+        accessed for the first time, so that reading the task only costs the metadata and the clients that
+        are never sampled never load their data.
+        Args:
+            loader: the function that loads the arrays of the features and the labels
+            length: the number of the samples
+        """
+        self.loader = loader
+        self.length = length
+        self._X = None
+        self._Y = None
+        self._all_labels = None
+
+    def _load(self):
+        X, Y = self.loader()
+        self._X, self._Y = torch.from_numpy(np.ascontiguousarray(X)), torch.from_numpy(np.ascontiguousarray(Y))
+
+    @property
+    def X(self):
+        if self._X is None: self._load()
+        return self._X
+
+    @property
+    def Y(self):
+        if self._Y is None: self._load()
+        return self._Y
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, item):
+        return self.X[item], self.Y[item]
+
+    def tolist(self):
+        return self.X.tolist(), self.Y.tolist()
+
+    @property
+    def all_labels(self):
+        if self._all_labels is None:
+            self._all_labels = torch.unique(self.Y).tolist()
+        return self._all_labels
+
+    def get_all_labels(self):
+        return self.all_labels
+
+class CollatedDataset(Dataset):
+    def __init__(self, dataset, batches):
+        """The dataset with its pre-collated batches (see BasicTaskCalculator.collate_dataset()), which are
+        iterated by the task calculators when testing instead of creating a DataLoader"""
+        self.dataset = dataset
+        self.batches = batches
+
+    def __getitem__(self, item):
+        return self.dataset[item]
+
+    def __len__(self):
+        return len(self.dataset)
+
+class SlidingWindowDataset(Dataset):
+    def __init__(self, text, starts, seq_length):
+        """The windows (x, y) = (text[s:s+seq_length], text[s+seq_length]) of the encoded text for each s in starts.
+        The text is kept as an uint8 tensor that can be shared by many datasets, and the windows are strided views
+        of it that are gathered (and converted to long) only when a sample or a batch is accessed.
+        Args:
+            text: the encoded text (uint8)
+            starts: the start positions of the windows
+            seq_length: the length of x
+        """
+        self.text = text if isinstance(text, torch.Tensor) else torch.as_tensor(np.asarray(text, dtype=np.uint8))
+        self.starts = torch.as_tensor(np.asarray(starts, dtype=np.int64))
+        self.seq_length = seq_length
+        # the windows are gathered a batch at once by indexing the dataset with a list of indices
+        self.batched = True
+        self._all_labels = None
+
+    @property
+    def windows(self):
+        # a view of shape [len(text)-seq_length, seq_length+1] without copying the text
+        return self.text.unfold(0, self.seq_length + 1, 1)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, item):
+        """item is an index or a list of indices (i.e. a batch drawn by BatchSampler)"""
+        if isinstance(item, (list, tuple)): item = torch.as_tensor(item, dtype=torch.long)
+        w = self.windows[self.starts[item]].long()
+        return w[..., :-1], w[..., -1]
+
+    @property
+    def all_labels(self):
+        if self._all_labels is None:
+            self._all_labels = torch.unique(self.text[self.starts + self.seq_length]).tolist()
+        return self._all_labels
+
+    def get_all_labels(self):
+        return self.all_labels
+
 class TupleDataset(Dataset):
     def __init__(self, X1=[], X2=[], Y=[], totensor=True):
         if totensor:
@@ -0,0 +1,117 @@
+# Cached pipeline of the X-ray (pneumonia) images, shared by easyFL's cifar10_classification and the Flower clients
+# (flower_common/pn_clients.py, which imports it as easyFL.benchmark.xray from the root of the repository)
+#
+# The deterministic part of the preprocessing (decoding + resizing) is executed once per image folder and cached
+# as an uint8 tensor store next to the folder (<root>.xray<size>.pt), and the random part of the training transform
+# (RandomRotation(+-3 degrees) + CenterCrop(224)) and Normalize are applied on whole batches on the device by
+# affine grid sampling (see augment_batch), instead of per PIL image in the DataLoader of each epoch.
+#     store = XRayStore('mydata/pn1/train', size=256)
+#     loader = XRayLoader(store, batch_size=16, shuffle=True, train=True, device=DEVICE)
+
+import concurrent.futures
+import math
+import os
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset
+
+MEAN = [0.485, 0.456, 0.406]
+STD = [0.229, 0.224, 0.225]
+IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp')
+
+
+def list_image_folder(root):
+    """List the (path, label) of the images in root/<class>/... as torchvision.datasets.ImageFolder does"""
+    classes = sorted(entry.name for entry in os.scandir(root) if entry.is_dir())
+    samples = []
+    for label, cls in enumerate(classes):
+        for dirpath, _, filenames in sorted(os.walk(os.path.join(root, cls), followlinks=True)):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMG_EXTENSIONS):
+                    samples.append((os.path.join(dirpath, filename), label))
+    return classes, samples
+
+
+def decode_image(path, size):
+    from PIL import Image
+    with open(path, 'rb') as f:
+        img = Image.open(f).convert('RGB').resize((size, size), Image.BILINEAR)
+    return torch.from_numpy(np.asarray(img, dtype=np.uint8).copy()).permute(2, 0, 1)
+
+
+class XRayStore(Dataset):
+    """The images of an image folder decoded and resized to size x size once, kept as an uint8 tensor [N, 3, size, size]"""
+    def __init__(self, root, size=256, num_threads=8):
+        root = os.path.normpath(root)
+        classes, samples = list_image_folder(root)
+        cache_path = '{}.xray{}.pt'.format(root, size)
+        cache = torch.load(cache_path) if os.path.exists(cache_path) else None
+        if cache is None or cache['files'] != [os.path.relpath(p, root) for p, _ in samples]:
+            # PIL releases the GIL when decoding and resizing, so the images are decoded by a pool of threads
+            with concurrent.futures.ThreadPoolExecutor(num_threads) as pool:
+                images = list(pool.map(lambda s: decode_image(s[0], size), samples))
+            cache = {
+                'files': [os.path.relpath(p, root) for p, _ in samples],
+                'images': torch.stack(images) if images else torch.zeros((0, 3, size, size), dtype=torch.uint8),
+                'labels': torch.tensor([label for _, label in samples], dtype=torch.long),
+            }
+            torch.save(cache, cache_path)
+        self.root = root
+        self.size = size
+        self.classes = classes
+        self.images = cache['images']
+        self.labels = cache['labels']
+        self.targets = self.labels.tolist()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, item):
+        return self.images[item], self.targets[item]
+
+
+def augment_batch(images, train=True, degrees=3.0, crop=224, mean=MEAN, std=STD):
+    """
+    Transform a batch of uint8 images [B, 3, H, W] into the normalized float inputs [B, 3, crop, crop].
+    When train is True, each image is rotated by a random angle in [-degrees, degrees] around its center (the
+    corners are filled with 0 as RandomRotation does) and center cropped, which is one affine grid sampling;
+    otherwise the images are only center cropped (if larger than crop).
+    """
+    x = images.float().div_(255.0)
+    B, _, H, W = x.shape
+    if train:
+        angles = (torch.rand(B, device=x.device) * 2 - 1) * math.radians(degrees)
+        cos, sin = torch.cos(angles), torch.sin(angles)
+        # the output grid covers the central crop x crop pixels of the rotated image
+        sx, sy = crop / W, crop / H
+        theta = torch.stack([
+            torch.stack([cos * sx, -sin * sy, torch.zeros_like(cos)], dim=1),
+            torch.stack([sin * sx, cos * sy, torch.zeros_like(cos)], dim=1),
+        ], dim=1)
+        grid = F.affine_grid(theta, (B, 3, crop, crop), align_corners=False)
+        x = F.grid_sample(x, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+    elif H > crop or W > crop:
+        top, left = (H - crop) // 2, (W - crop) // 2
+        x = x[:, :, top:top + crop, left:left + crop]
+    mean = torch.tensor(mean, device=x.device).view(1, -1, 1, 1)
+    std = torch.tensor(std, device=x.device).view(1, -1, 1, 1)
+    return (x - mean) / std
+
+
+class XRayLoader:
+    """Iterate the batches (augment_batch(images), labels) of a store on the device"""
+    def __init__(self, store, batch_size=16, shuffle=True, train=True, device='cpu', crop=224):
+        self.dataset = store
+        self.loader = DataLoader(store, batch_size=batch_size, shuffle=shuffle, pin_memory=torch.device(device).type == 'cuda')
+        self.train = train
+        self.device = device
+        self.crop = crop
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for images, labels in self.loader:
+            images = images.to(self.device, non_blocking=True)
+            yield augment_batch(images, train=self.train, crop=self.crop), labels.to(self.device, non_blocking=True)
@@ -1,8 +1,19 @@
+import os
 import utils.fflow as flw
 
 def main():
     # read options
     option = flw.read_option()
+    # run the configuration with several seeds in one process
+    if option['seeds']:
+        import utils.multiseed
+        utils.multiseed.run_seeds(option)
+        return
+    # run the system over the ranks launched by torchrun (with more than one rank)
+    if int(os.environ.get('WORLD_SIZE', '1')) > 1:
+        import utils.distributed
+        utils.distributed.run(option)
+        return
     # set random seed
     flw.setup_seed(option['seed'])
     # initialize server
@@ -0,0 +1,111 @@
+"""
+Run a grid of configurations in one process, where each fedtask is read only once and its datasets are
+shared by all the runs on it. The grid is described by a .json file like:
+    {
+        "base": {"task": "mnist_classification_cnum100_dist0_skew0_seed0", "model": "cnn", "num_rounds": 20},
+        "grid": {"algorithm": ["fedavg", "fedprox"], "learning_rate": [0.1, 0.05], "seed": [0, 1]},
+        "configs": [{"algorithm": "qfedavg", "q": 1.0}]
+    }
+where each configuration is 'base' updated by one combination of the values in 'grid' (the cartesian
+product), and the configurations in 'configs' (also updated from 'base') are run as well. The options
+not specified keep the default values of utils/fflow.read_option, and each run writes the same record
+as `python main.py` does.
+
+The runs on a task are executed back-to-back, or concurrently by a pool of processes forked after reading
+the task (--num_workers > 1), so that the workers share the in-memory datasets of the task.
+
+Usage (from the directory easyFL):
+    python sweep.py --grid grid.json --num_workers 4
+"""
+import argparse
+import collections
+import itertools
+import multiprocessing
+import time
+import traceback
+import ujson
+import torch
+import utils.fflow as flw
+
+# the fedtask shared by the workers that are forked after reading it
+_TASK_DATA = None
+
+def read_option():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--grid', help='the path of the .json file that describes the grid of configurations;', type=str, required=True)
+    parser.add_argument('--num_workers', help='the number of processes that run the configurations on the same task concurrently;', type=int, default=1)
+    parser.add_argument('--torch_threads', help='the number of threads of torch in each worker, which is cpu_count/num_workers as default;', type=int, default=0)
+    try: option = vars(parser.parse_args())
+    except IOError as msg: parser.error(str(msg))
+    return option
+
+def expand_grid(grid):
+    """Return the list of the options of all the configurations in the grid"""
+    base = grid.get('base', {})
+    keys = list(grid.get('grid', {}).keys())
+    configs = [dict(zip(keys, values)) for values in itertools.product(*[grid['grid'][k] for k in keys])] if keys else []
+    configs.extend(grid.get('configs', []))
+    if not configs: configs = [{}]
+    options = []
+    default = flw.read_option([])
+    for config in configs:
+        option = dict(default)
+        for key, value in list(base.items()) + list(config.items()):
+            if key not in default:
+                raise RuntimeError("Unknown option '{}' in the grid.".format(key))
+            option[key] = value
+        options.append(option)
+    return options
+
+def touch_task(task_data):
+    """Access each dataset of the task once, so that the lazily built data is shared by the forked workers"""
+    train_datas, valid_datas, test_data, _ = task_data
+    for data in train_datas + valid_datas + [test_data]:
+        if data is not None and len(data) > 0: data[0]
+
+def run_config(option, task_data=None):
+    """Run a single configuration and return its status"""
+    if task_data is None: task_data = _TASK_DATA
+    start = time.time()
+    try:
+        flw.setup_seed(option['seed'])
+        server = flw.initialize(option, task_data)
+        server.run()
+        return {'status': 'ok', 'time': time.time() - start, 'record': flw.output_filename(option, server)}
+    except Exception:
+        return {'status': 'failed', 'time': time.time() - start, 'error': traceback.format_exc()}
+
+def init_worker(torch_threads):
+    if torch_threads > 0: torch.set_num_threads(torch_threads)
+
+def run_task(options, num_workers=1, torch_threads=0):
+    """Read the task of the options once and run all of them on it"""
+    global _TASK_DATA
+    print("load fedtask {}...".format(options[0]['task']), end='')
+    _TASK_DATA = flw.load_task(options[0])
+    print('done')
+    if num_workers <= 1:
+        return [run_config(option, _TASK_DATA) for option in options]
+    touch_task(_TASK_DATA)
+    if torch_threads <= 0: torch_threads = max(multiprocessing.cpu_count() // num_workers, 1)
+    # the workers are forked to share the task with this process (CUDA should not be initialized before forking)
+    with multiprocessing.get_context('fork').Pool(num_workers, initializer=init_worker, initargs=(torch_threads,)) as pool:
+        return pool.map(run_config, options, chunksize=1)
+
+if __name__ == '__main__':
+    option = read_option()
+    with open(option['grid'], 'r') as inf:
+        grid = ujson.load(inf)
+    options = expand_grid(grid)
+    tasks = collections.OrderedDict()
+    for opt in options: tasks.setdefault(opt['task'], []).append(opt)
+    print("{} configurations on {} fedtasks".format(len(options), len(tasks)))
+    results = []
+    for task, task_options in tasks.items():
+        for opt, res in zip(task_options, run_task(task_options, option['num_workers'], option['torch_threads'])):
+            results.append((opt, res))
+    print("=================Sweep==================")
+    for opt, res in results:
+        print("{:<8s}{:<10.2f}{} on {}: {}".format(res['status'], res['time'], opt['algorithm'], opt['task'], res.get('record', '')))
+    for opt, res in results:
+        if res['status'] != 'ok': print(res['error'])
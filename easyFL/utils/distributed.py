@@ -0,0 +1,110 @@
+"""This module is designed for running one federated system over several processes (ranks) by torch.distributed
+with the gloo backend, e.g. on a single machine with 4 ranks:
+    torchrun --nproc_per_node 4 main.py --task ... --algorithm fedavg
+or on several machines by torchrun --nnodes/--node_rank/--master_addr. Each rank builds the system as
+`python main.py` does and owns the shard of the clients {k: k % world_size == rank}. Each round is executed as:
+    1. rank 0 evaluates the global model, samples the clients and broadcasts the selected clients and the
+       flattened global model to all the ranks
+    2. each rank trains the selected clients of its shard and sums pk * model_k (and pk) into a flat buffer
+    3. the buffers are summed over the ranks by all_reduce, and each rank computes the new global model from
+       the sum as BasicServer.aggregate() does
+so that the cost of the local training is divided among the ranks and only the flat buffers of the models are
+exchanged. Only rank 0 evaluates and writes the record. The supported algorithms are those that keep the standard
+iterate() and aggregate() of BasicServer (e.g. fedavg, fedprox), and the clients are trained on CPU. Each rank reads
+the whole task and builds all the clients, since the server samples among all of them and rank 0 evaluates on the
+local datasets of all of them, so only the cost of the local training is divided among the ranks.
+"""
+import os
+import numpy as np
+import torch
+import torch.distributed as dist
+import utils.fflow as flw
+import utils.network_simulator as ns
+import utils.robust_aggregation
+from algorithm.fedbase import BasicServer
+
+def _flat_tensors(model):
+    return [t for t in model.state_dict().values() if t.is_floating_point()]
+
+def flatten(model):
+    return torch.cat([t.detach().reshape(-1).to('cpu', torch.float64) for t in _flat_tensors(model)])
+
+def load_flat(model, vector):
+    """Load the flat buffer into the floating-point parameters and buffers of the model in place"""
+    beg = 0
+    with torch.no_grad():
+        for t in _flat_tensors(model):
+            end = beg + t.numel()
+            t.copy_(vector[beg:end].view_as(t))
+            beg = end
+    return model
+
+def broadcast_object(obj, src=0):
+    objs = [obj]
+    dist.broadcast_object_list(objs, src=src)
+    return objs[0]
+
+def iterate(server, t, rank, world_size):
+    """One round of server.iterate() over the ranks"""
+    # rank 0 samples the clients and broadcasts them with the global model
+    selected_clients = ns.drop_overdue_clients(server, server.sample()) if rank == 0 else None
+    server.selected_clients = broadcast_object(selected_clients)
+    global_vector = flatten(server.model)
+    dist.broadcast(global_vector, src=0)
+    load_flat(server.model, global_vector)
+    # train the selected clients of the shard and sum [Σpk * model_k, Σpk, K] of the shard
+    local_clients = [cid for cid in server.selected_clients if cid % world_size == rank]
+    buffer = torch.zeros(len(global_vector) + 2, dtype=torch.float64)
+    for cid, pk in zip(local_clients, server.aggregation_weights(local_clients)):
+        reply = server.communicate_with(cid)
+        if not reply: continue
+        buffer[:-2] += pk * flatten(reply['model'])
+        buffer[-2] += pk
+        buffer[-1] += 1
+    dist.all_reduce(buffer, op=dist.ReduceOp.SUM)
+    s, sump, K = buffer[:-2], buffer[-2].item(), int(buffer[-1].item())
+    if K == 0: return
+    if server.agg_option == 'weighted_scale':
+        w = s * server.num_clients / K
+    elif server.agg_option == 'uniform':
+        w = s / K
+    elif server.agg_option == 'weighted_com':
+        w = (1.0 - sump) * global_vector + s
+    else:
+        w = s / sump
+    load_flat(server.model, w)
+    return
+
+def run(option):
+    """Run the federated system specified by option on the ranks launched by torchrun"""
+    dist.init_process_group('gloo')
+    rank, world_size = dist.get_rank(), dist.get_world_size()
+    # the same seed builds the same system on all the ranks, and the local training of each rank draws its own random streams
+    flw.setup_seed(option['seed'])
+    server = flw.initialize(option)
+    if type(server).iterate is not BasicServer.iterate or type(server).aggregate is not BasicServer.aggregate:
+        raise RuntimeError("The distributed backend only supports the algorithms with the standard iterate() and aggregate() of BasicServer.")
+    if server.agg_option in utils.robust_aggregation.RULES or server.secure_aggregation is not None:
+        raise RuntimeError("The distributed backend only aggregates the weighted sums of the models, which doesn't support {} or the secure aggregation.".format(server.agg_option))
+    if rank > 0:
+        np.random.seed(21 + option['seed'] + 1000 * rank)
+        torch.manual_seed(12 + option['seed'] + 1000 * rank)
+    print("Rank {}/{} owns {} clients".format(rank, world_size, len(range(rank, server.num_clients, world_size))))
+    flw.logger.time_start('Total Time Cost')
+    for round in range(server.num_rounds + 1):
+        if rank == 0: print("--------------Round {}--------------".format(round))
+        server.current_round = round
+        flw.logger.time_start('Time Cost')
+        if rank == 0 and flw.logger.check_if_log(round, server.eval_interval):
+            flw.logger.time_start('Eval Time Cost')
+            flw.logger.log(server, current_round=round)
+            flw.logger.time_end('Eval Time Cost')
+        iterate(server, round, rank, world_size)
+        server.global_lr_scheduler(round)
+        flw.logger.time_end('Time Cost')
+    flw.logger.time_end('Total Time Cost')
+    if rank == 0:
+        print("=================End==================")
+        flw.logger.save(os.path.join('fedtask', option['task'], 'record', flw.output_filename(option, server)))
+    dist.destroy_process_group()
+    return
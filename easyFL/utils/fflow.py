@@ -9,14 +9,17 @@ import utils.fmodule
 import ujson
 import time
 import collections
+import concurrent.futures
 import utils.network_simulator as ns
 
-sample_list=['uniform', 'md']
-agg_list=['uniform', 'weighted_scale', 'weighted_com']
+sample_list=['uniform', 'md', 'uniform_available', 'md_available']
+agg_list=['uniform', 'weighted_scale', 'weighted_com', 'median', 'trimmed_mean', 'krum', 'multi_krum', 'geometric_median']
 optimizer_list=['SGD', 'Adam']
 logger = None
+tracer = None
+profiler = None
 
-def read_option():
+def read_option(args=None):
     parser = argparse.ArgumentParser()
     # basic settings
     parser.add_argument('--task', help='name of fedtask;', type=str, default='mnist_cnum100_dist0_skew0_seed0')
@@ -26,6 +29,7 @@ def read_option():
     # methods of server side for sampling and aggregating
     parser.add_argument('--sample', help='methods for sampling clients', type=str, choices=sample_list, default='md')
     parser.add_argument('--aggregate', help='methods for aggregating models', type=str, choices=agg_list, default='uniform')
+    parser.add_argument('--byzantine_ratio', help='the assumed ratio of the malicious clients among the selected clients for trimmed_mean, krum and multi_krum', type=float, default=0.1)
     parser.add_argument('--learning_rate_decay', help='learning rate decay for the training process;', type=float, default=0.998)
     parser.add_argument('--weight_decay', help='weight decay for the training process', type=float, default=0)
     parser.add_argument('--lr_scheduler', help='type of the global learning rate scheduler', type=int, default=-1)
@@ -39,12 +43,28 @@ def read_option():
     parser.add_argument('--batch_size', help='batch size when clients trainset on data;', type=float, default='64')
     parser.add_argument('--optimizer', help='select the optimizer for gd', type=str, choices=optimizer_list, default='SGD')
     parser.add_argument('--momentum', help='momentum of local update', type=float, default=0)
+    parser.add_argument('--dp', help='train the clients by DP-SGD with per-sample gradients (1) or not (0)', type=int, choices=[0, 1], default=0)
+    parser.add_argument('--dp_noise_multiplier', help='the ratio of the std of the Gaussian noise to the clipping norm in DP-SGD', type=float, default=1.0)
+    parser.add_argument('--dp_max_grad_norm', help='the norm that each per-sample gradient is clipped to in DP-SGD', type=float, default=1.0)
+    parser.add_argument('--dp_delta', help='the delta of the (epsilon, delta)-DP reported for DP-SGD', type=float, default=1e-5)
+    parser.add_argument('--secure_aggregation', help='aggregate the models masked by the pairwise masks of the clients so that the server only obtains their weighted sum (1) or not (0)', type=int, choices=[0, 1], default=0)
 
     # machine environment settings
     parser.add_argument('--seed', help='seed for random initialization;', type=int, default=0)
+    parser.add_argument('--seeds', help='the seeds to run the same configuration with inside one process (e.g. --seeds 0 1 2), which overrides --seed and trains the clients of all the seeds in lockstep when the algorithm supports it;', type=int, nargs='+', default=[])
     parser.add_argument('--gpu', help='GPU ID, -1 for CPU', type=int, default=-1)
     parser.add_argument('--eval_interval', help='evaluate every __ rounds;', type=int, default=1)
+    parser.add_argument('--test_cache', help='collate the testing dataset of the server into batches once, which are put on the device (device) or kept in the pinned memory (pinned), or build a DataLoader for each evaluation (none)', type=str, choices=['none', 'device', 'pinned'], default='none')
+    parser.add_argument('--num_workers', help='the number of worker processes of the DataLoaders of local training, and the default of the task calculator is used if not specified', type=int, default=None)
+    parser.add_argument('--pin_memory', help='whether to pin the batches of local training before copying them to GPU (1) or not (0), and the default of the task calculator is used if not specified', type=int, choices=[0, 1], default=None)
+    parser.add_argument('--prefetch', help='the number of batches of local training prepared in background while the current batch is computed (0 to disable), and the default of the task calculator is used if not specified', type=int, default=None)
+    parser.add_argument('--compile', help='compile the forward of the model by torch.compile once per process and reuse it for the training and evaluation of all the clients (1) or run it eagerly (0)', type=int, choices=[0, 1], default=0)
+    parser.add_argument('--eval_mode', help='evaluate the global model in the round loop (sync) or evaluate its snapshot in a background thread while the next rounds are training (background)', type=str, choices=['sync', 'background'], default='sync')
     parser.add_argument('--num_threads', help="the number of threads in the clients computing session", type=int, default=1)
+    parser.add_argument('--train_mode', help="train the selected clients one after another (sequential) or in lockstep by torch.func (cohort), which falls back to sequential for the algorithms with custom local training", type=str, choices=['sequential', 'cohort'], default='sequential')
+    parser.add_argument('--trace', help='whether to trace the time cost of each phase in every round (1) or not (0)', type=int, default=0)
+    parser.add_argument('--profile_rounds', help='the first and the last round of the window to be profiled (e.g. --profile_rounds 5 7), and no round will be profiled as default', type=int, nargs=2, default=[])
+    parser.add_argument('--profiler', help='the profilers used for the rounds in the window', type=str, choices=['torch', 'cprofile', 'both'], default='both')
 
     # the simulating system settings of clients
     # constructing the heterogeity of the network
@@ -67,7 +87,10 @@ def read_option():
     parser.add_argument('--alg', help='clustered sampling', type=int, default=1)
     parser.add_argument('--w', help='whether to wait for all updates being initialized before aggregation', type=int, default=1)
     parser.add_argument('--c', help='proportion of clients keeping original direction in FedFV/alpha in fedFA', type=float, default='0.0')
-    try: option = vars(parser.parse_args())
+    parser.add_argument('--num_edges', help='the number of edge aggregators in hierarchical', type=int, default=4)
+    parser.add_argument('--edge_rounds', help='the number of edge rounds of each edge between two cloud aggregations in hierarchical', type=int, default=1)
+    parser.add_argument('--num_edge_workers', help='the number of processes that run the edges in parallel in hierarchical', type=int, default=1)
+    try: option = vars(parser.parse_args(args))
     except IOError as msg: parser.error(str(msg))
     return option
 
@@ -78,7 +101,36 @@ def setup_seed(seed):
     torch.manual_seed(12+seed)
     torch.cuda.manual_seed_all(123+seed)
 
-def initialize(option):
+def load_task(option):
+    """
+    Read the fedtask specified by option['task'], which can be shared by the runs on the same task.
+    :param
+        option: the options of the run
+    :return
+        train_datas, valid_datas, test_data, client_names
+    """
+    bmk_name = option['task'][:option['task'].find('cnum')-1].lower()
+    bmk_core_path = '.'.join(['benchmark', bmk_name, 'core'])
+    task_reader = getattr(importlib.import_module(bmk_core_path), 'TaskReader')(taskpath=os.path.join('fedtask', option['task']))
+    return task_reader.read_data()
+
+def initialize(option, task_data=None):
+    """
+    Initialize the federated system.
+    :param
+        option: the options of the run
+        task_data: the fedtask returned by load_task(option), which will be read from the disk if it's None
+    :return
+        the server of the federated system
+    """
+    # the time costs of the stages of initializing, which are printed after the system is ready
+    startup_costs = collections.OrderedDict()
+    tic = time.perf_counter()
+    def record_startup_cost(stage):
+        nonlocal tic
+        toc = time.perf_counter()
+        startup_costs[stage] = toc - tic
+        tic = toc
     # init fedtask
     print("init fedtask...", end='')
     # dynamical initializing the configuration with the benchmark
@@ -88,12 +140,15 @@ def initialize(option):
     utils.fmodule.device = torch.device('cuda:{}'.format(option['gpu']) if torch.cuda.is_available() and option['gpu'] != -1 else 'cpu')
     utils.fmodule.TaskCalculator = getattr(importlib.import_module(bmk_core_path), 'TaskCalculator')
     utils.fmodule.TaskCalculator.setOP(getattr(importlib.import_module('torch.optim'), option['optimizer']))
+    utils.fmodule.TaskCalculator.setLoader(**{k: (bool(option[k]) if k == 'pin_memory' else option[k]) for k in ['num_workers', 'pin_memory', 'prefetch'] if option.get(k) is not None})
+    utils.fmodule.TaskCalculator.setCompile(bool(option['compile']))
     # The Model is defined in bmk_model_path as default, whose filename is option['model'] and the classname is 'Model'
     # If an algorithm change the backbone for a task, a modified model should be defined in the path 'algorithm/method_name.py', whose classname is option['model']
     try:
         utils.fmodule.Model = getattr(importlib.import_module(bmk_model_path), 'Model')
     except ModuleNotFoundError:
         utils.fmodule.Model = getattr(importlib.import_module('.'.join(['algorithm', option['algorithm']])), option['model'])
+    record_startup_cost('import benchmark')
     model = utils.fmodule.Model().to(utils.fmodule.device)
     try:
         if option['pretrain'] != '':
@@ -101,10 +156,12 @@ def initialize(option):
     except:
         print("Invalid Model Configuration.")
         exit(1)
+    record_startup_cost('create model')
     # read federated task by TaskReader
-    task_reader = getattr(importlib.import_module(bmk_core_path), 'TaskReader')(taskpath=os.path.join('fedtask', option['task']))
-    train_datas, valid_datas, test_data, client_names = task_reader.read_data()
+    if task_data is None: task_data = load_task(option)
+    train_datas, valid_datas, test_data, client_names = task_data
     num_clients = len(client_names)
+    record_startup_cost('read task')
     print("done")
 
     # init client
@@ -112,22 +169,46 @@ def initialize(option):
     client_path = '%s.%s' % ('algorithm', option['algorithm'])
     Client=getattr(importlib.import_module(client_path), 'Client')
     clients = [Client(option, name = client_names[cid], train_data = train_datas[cid], valid_data = valid_datas[cid]) for cid in range(num_clients)]
+    record_startup_cost('init clients')
     print('done')
 
     # init server
     print("init server...", end='')
     server_path = '%s.%s' % ('algorithm', option['algorithm'])
     server = getattr(importlib.import_module(server_path), 'Server')(option, model, clients, test_data = test_data)
+    # cache the batches of the testing dataset
+    if option['test_cache'] != 'none' and server.test_data is not None:
+        server.test_data = server.calculator.collate_dataset(server.test_data, cache=option['test_cache'])
     # init virtual network environment
     ns.init_network_environment(server)
+    record_startup_cost('init server')
     # init logger
     try:
         Logger = getattr(importlib.import_module(server_path), 'MyLogger')
     except AttributeError:
-        Logger = DefaultLogger
+        Logger = BackgroundLogger if option['eval_mode'] == 'background' else DefaultLogger
+    if option['eval_mode'] == 'background' and not issubclass(Logger, BackgroundLogger):
+        raise RuntimeError("The logger of {} evaluates in the round loop, which doesn't support --eval_mode background.".format(option['algorithm']))
     global logger
     logger = Logger()
+    # init tracer
+    global tracer
+    tracer = None
+    if option['trace']:
+        import utils.tracer
+        tracer = utils.tracer.Tracer()
+        tracer.instrument(server, logger)
+    # init profiler, which is None when no round is profiled
+    global profiler
+    profiler = None
+    if option['profile_rounds']:
+        import utils.profiler
+        profiler = utils.profiler.RoundProfiler(option['profile_rounds'], option['profiler'], record_dir=os.path.join('fedtask', option['task'], 'record'), prefix=output_filename(option, server)[:-len('.json')])
+    record_startup_cost('init logger')
     print('done')
+    for stage, cost in startup_costs.items():
+        print("{:<30s}{:.4f}".format('Startup ' + stage + ':', cost) + 's')
+    print("{:<30s}{:.4f}".format('Startup Time Cost:', sum(startup_costs.values())) + 's')
     return server
 
 def output_filename(option, server):
@@ -176,10 +257,21 @@ class Logger:
             print("{:<30s}{:.4f}".format(key+":", self.time_buf[key][-1]) + 's')
 
     def save(self, filepath):
-        """Save the self.output as .json file"""
+        """Save the self.output as .json file and append it into the result store next to the .json file.
+        The statistics of the traced phases are saved together with the output, and the whole timeline is
+        saved into the directory 'trace' next to the .json file."""
         if len(self.output)==0: return
+        if tracer is not None:
+            self.output['trace'] = tracer.summary()
+            trace_dir = os.path.join(os.path.dirname(filepath), 'trace')
+            if not os.path.exists(trace_dir): os.makedirs(trace_dir)
+            tracer.save(os.path.join(trace_dir, os.path.basename(filepath)))
         with open(filepath, 'w') as outf:
             ujson.dump(dict(self.output), outf)
+        import utils.result_store
+        store = utils.result_store.ResultStore(os.path.join(os.path.dirname(filepath), utils.result_store.DB_NAME))
+        store.add_run(os.path.basename(filepath), dict(self.output))
+        store.close()
             
     def write(self, var_name=None, var_value=None):
         """Add variable 'var_name' and its value var_value to logger"""
@@ -197,9 +289,38 @@ class DefaultLogger(Logger):
     def log(self, server=None, current_round=-1):
         if len(self.output) == 0:
             self.output['meta'] = server.option
-        test_metric = server.test()
-        valid_metrics = server.test_on_clients(self.current_round, 'valid')
-        train_metrics = server.test_on_clients(self.current_round, 'train')
+        self.record(server, self.evaluate(server), self.dp_epsilon(server))
+
+    def evaluate(self, server, model=None, round=None):
+        """
+        Evaluate the model on the testing dataset of the server and the local datasets of the clients.
+        :param
+            server: the server of the federated system
+            model: the model to be evaluated, and the model selected by the server is evaluated if it's None
+            round: the round when the model is evaluated, which is self.current_round as default
+        :return
+            the metrics on the testing dataset, the training datasets and the validating datasets
+        """
+        if round is None: round = self.current_round
+        test_metric = server.test(model)
+        valid_metrics = server.test_on_clients(round, 'valid', model)
+        train_metrics = server.test_on_clients(round, 'train', model)
+        return test_metric, train_metrics, valid_metrics
+
+    def dp_epsilon(self, server):
+        """The largest privacy loss among the clients trained by DP-SGD at the current round, or None without DP"""
+        if not server.option.get('dp', 0): return None
+        return max([c.privacy.get_epsilon(server.option['dp_delta']) for c in server.clients])
+
+    def record(self, server, metrics, dp_epsilon=None):
+        """
+        Write the metrics returned by self.evaluate() into self.output and print them
+        :param
+            server: the server of the federated system
+            metrics: the metrics returned by self.evaluate()
+            dp_epsilon: the privacy loss returned by self.dp_epsilon() at the round of the metrics
+        """
+        test_metric, train_metrics, valid_metrics = metrics
         for met_name, met_val in test_metric.items():
             self.output['test_' + met_name].append(met_val)
         # calculate weighted averaging of metrics of training datasets across clients
@@ -210,7 +331,48 @@ class DefaultLogger(Logger):
             self.output['valid_' + met_name].append(1.0 * sum([client_vol * client_met for client_vol, client_met in zip(server.client_vols, met_val)]) / server.data_vol)
             self.output['mean_valid_' + met_name].append(np.mean(met_val))
             self.output['std_valid_' + met_name].append(np.std(met_val))
+        if dp_epsilon is not None:
+            self.output['dp_epsilon'].append(dp_epsilon)
         # output to stdout
         for key, val in self.output.items():
             if key == 'meta': continue
-            print(self.temp.format(key, val[-1]))
\ No newline at end of file
+            print(self.temp.format(key, val[-1]))
+
+class BackgroundLogger(DefaultLogger):
+    """
+    Evaluate the snapshot of the global model in a background thread while the next rounds are
+    training. The metrics are written into self.output in the order of the rounds, and the logger
+    blocks the round loop only when max_pending snapshots are still waiting to be evaluated.
+    Since the evaluation shares the random generators of torch with the local training, the runs
+    are not bitwise reproducible in this mode.
+    """
+    max_pending = 2
+
+    def __init__(self):
+        super(BackgroundLogger, self).__init__()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.pending = collections.deque()
+        self.server = None
+
+    def log(self, server=None, current_round=-1):
+        if len(self.output) == 0:
+            self.output['meta'] = server.option
+        self.server = server
+        # the privacy loss is taken with the snapshot, since the clients keep training while it is evaluated
+        future = self.executor.submit(self.evaluate, server, server.snapshot(), self.current_round)
+        self.pending.append((self.current_round, future, self.dp_epsilon(server)))
+        self.drain(server, wait=False)
+
+    def drain(self, server, wait=False):
+        """Record the metrics of the evaluated snapshots in order, waiting for all of them if wait is True"""
+        while self.pending:
+            round, future, dp_epsilon = self.pending[0]
+            if not (wait or future.done() or len(self.pending) > self.max_pending): break
+            self.pending.popleft()
+            print("--------------Evaluation of Round {}--------------".format(round))
+            self.record(server, future.result(), dp_epsilon)
+
+    def save(self, filepath):
+        self.drain(self.server, wait=True)
+        self.executor.shutdown(wait=True)
+        super(BackgroundLogger, self).save(filepath)
@@ -0,0 +1,138 @@
+"""This module is designed for training many models of the same architecture in lockstep, which
+is efficient for small models (e.g. lr, mlp and vec) whose local training is dominated by the
+python and kernel-launch overhead. The parameters of the K models are stacked along a leading
+dimension, and each step of them is executed as a single computation:
+    1. draw one batch for each model, pad the batches into the same size (the padded items are masked)
+    2. compute the K gradients by torch.func.vmap(torch.func.grad(loss)) where the loss is computed by
+       TaskCalculator.functional_loss(model, params, batch, mask) through torch.func.functional_call
+    3. update the K models by the vectorized SGD (with momentum and weight decay)
+The models with buffers (e.g. BatchNorm) and the optimizers except SGD are not supported, and the
+callers should fall back to the sequential training in these cases (see can_train_in_lockstep()).
+"""
+import torch
+from benchmark.toolkits import BasicTaskCalculator
+
+def can_train_in_lockstep(model, calculator, optimizer_name='SGD'):
+    """
+    Check whether the model can be trained by train_in_lockstep().
+    :param
+        model: the model to be trained
+        calculator: the task calculator of the clients
+        optimizer_name: the name of the optimizer of local training
+    :return
+        True if the optimizer is SGD, the model has no buffer and the calculator implements functional_loss()
+    """
+    # torch.func is available since torch 2.0
+    if not hasattr(torch, 'func'): return False
+    if optimizer_name.lower() != 'sgd': return False
+    if len(list(model.buffers())) > 0: return False
+    return type(calculator).functional_loss is not BasicTaskCalculator.functional_loss
+
+def stack_params(models):
+    """Stack the parameters of the models into a dict {name: tensor of shape [K, ...]}"""
+    named_params = [dict(m.named_parameters()) for m in models]
+    return {name: torch.stack([nps[name].detach() for nps in named_params]) for name in named_params[0].keys()}
+
+@torch.no_grad()
+def unstack_params(params, models):
+    """Load the stacked parameters back into the models"""
+    for k, m in enumerate(models):
+        for name, p in m.named_parameters():
+            p.copy_(params[name][k])
+
+def pad_batches(batches):
+    """
+    Pad the batches into the same size and stack them.
+    :param
+        batches: a list of K batches, each of which is a tensor or a tuple of tensors that have the same length
+    :return
+        the stacked batch with the same structure as each batch (i.e. tensors of shape [K, B, ...]) and the mask of shape [K, B]
+    """
+    is_tensor = isinstance(batches[0], torch.Tensor)
+    batches = [(b,) if is_tensor else tuple(b) for b in batches]
+    sizes = [len(b[0]) for b in batches]
+    max_size = max(sizes)
+    stacked = []
+    for i in range(len(batches[0])):
+        items = []
+        for b, n in zip(batches, sizes):
+            # pad the batch by repeating its first item, which is masked out from the loss
+            items.append(b[i] if n == max_size else torch.cat([b[i], b[i][:1].expand(max_size - n, *b[i].shape[1:])]))
+        stacked.append(torch.stack(items))
+    mask = torch.zeros(len(batches), max_size, device=stacked[0].device)
+    for k, n in enumerate(sizes): mask[k, :n] = 1.0
+    return (stacked[0] if is_tensor else tuple(stacked)), mask
+
+class LockstepSGD:
+    """The vectorized version of torch.optim.SGD (without dampening and nesterov) for the stacked parameters"""
+    def __init__(self, params, lrs, momentum=0, weight_decay=0):
+        """
+        :param
+            params: the stacked parameters
+            lrs: a tensor of shape [K] that contains the learning rate of each model
+            momentum: momentum factor
+            weight_decay: weight decay (L2 penalty)
+        """
+        self.lrs = lrs
+        self.momentum = momentum
+        self.weight_decay = weight_decay
+        self.bufs = {name: torch.zeros_like(p) for name, p in params.items()} if momentum != 0 else None
+
+    @torch.no_grad()
+    def step(self, params, grads, active):
+        """
+        Update the parameters of the active models.
+        :param
+            params: the stacked parameters
+            grads: the stacked gradients
+            active: a bool tensor of shape [K], and the models that are not active are kept unchanged
+        :return
+            the updated parameters
+        """
+        res = {}
+        for name, p in params.items():
+            shape = (-1,) + (1,) * (p.dim() - 1)
+            d_p = grads[name] if self.weight_decay == 0 else grads[name] + self.weight_decay * p
+            if self.bufs is not None:
+                # the buffer is zero at the first step so that it equals d_p as torch.optim.SGD does
+                buf = self.momentum * self.bufs[name] + d_p
+                self.bufs[name] = torch.where(active.view(shape), buf, self.bufs[name])
+                d_p = buf
+            res[name] = torch.where(active.view(shape), p - self.lrs.view(shape) * d_p, p)
+        return res
+
+def train_in_lockstep(clients, models, draw_batches=None):
+    """
+    Train the models in lockstep, where models[k] is trained by clients[k] as BasicClient.train() does (i.e.
+    clients[k].num_steps steps of SGD on the batches returned by clients[k].get_batch_data()).
+    :param
+        clients: the clients that train the models (the same client can appear more than once)
+        models: the models to be trained, which are updated in place
+        draw_batches: a function (active) -> list that returns the batches of the models where active[k] is
+                      True (the batches of others will be ignored), which draws from the clients as default
+    """
+    calculator = clients[0].calculator
+    if draw_batches is None:
+        draw_batches = lambda active: [c.get_batch_data() if a else None for c, a in zip(clients, active)]
+    template = models[0]
+    for m in models: m.train()
+    device = next(template.parameters()).device
+    params = stack_params(models)
+    num_steps = [c.num_steps for c in clients]
+    optimizer = LockstepSGD(params, torch.tensor([c.learning_rate for c in clients], device=device), momentum=clients[0].momentum, weight_decay=clients[0].weight_decay)
+
+    def loss(p, batch, mask):
+        return calculator.functional_loss(template, p, batch, mask)
+    compute_grads = torch.func.vmap(torch.func.grad(loss), randomness='different')
+
+    for step in range(max(num_steps)):
+        active = [step < n for n in num_steps]
+        batches = [calculator.data_to_device(b, train=True) if b is not None else None for b in draw_batches(active)]
+        # the models that have finished training compute on a copy of an active batch and are not updated
+        placeholder = next(b for b in batches if b is not None)
+        batch, mask = pad_batches([b if b is not None else placeholder for b in batches])
+        grads = compute_grads(params, batch, mask)
+        params = optimizer.step(params, grads, torch.tensor(active, device=device))
+    unstack_params(params, models)
+    for c in set(clients): c.release_data()
+    return
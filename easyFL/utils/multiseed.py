@@ -0,0 +1,129 @@
+"""This module is designed for running the same configuration with several seeds inside one process.
+The fedtask is read only once and shared by the federated systems of the seeds, and each round of
+the systems is executed in three stages:
+    1. each server evaluates its global model, samples clients and sends them the global model
+    2. the local training of the selected clients of all the systems is executed in lockstep (see utils/functional.py)
+    3. each server aggregates the received models
+The random states (random, numpy and torch) and the logger of each system are swapped in whenever the
+system is running, so that each system consumes its own random streams and writes its own record as
+`python main.py --seed s` does.
+The lockstep execution only supports the algorithms that keep the standard run/iterate/communicate of
+BasicServer (without the secure aggregation) and the standard reply/train of BasicClient with the SGD optimizer, and the systems of other
+algorithms are run one after another (sharing the fedtask).
+"""
+import contextlib
+import os
+import random
+import numpy as np
+import torch
+import utils.fflow as flw
+import utils.functional
+import utils.network_simulator as ns
+from algorithm.fedbase import BasicServer, BasicClient
+
+class SeedContext:
+    """The random states and the logging objects of utils.fflow owned by the federated system of a seed"""
+    def __init__(self, seed, option):
+        self.seed = seed
+        self.option = option
+        self.server = None
+        self.rng_state = None
+        self.loggers = None
+
+    def save(self):
+        self.rng_state = (random.getstate(), np.random.get_state(), torch.get_rng_state(), torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None)
+        self.loggers = (flw.logger, flw.tracer, flw.profiler)
+
+    def restore(self):
+        random.setstate(self.rng_state[0])
+        np.random.set_state(self.rng_state[1])
+        torch.set_rng_state(self.rng_state[2])
+        if self.rng_state[3] is not None: torch.cuda.set_rng_state_all(self.rng_state[3])
+        flw.logger, flw.tracer, flw.profiler = self.loggers
+
+    @contextlib.contextmanager
+    def activated(self):
+        self.restore()
+        try:
+            yield self
+        finally:
+            self.save()
+
+def can_run_in_lockstep(contexts):
+    server = contexts[0].server
+    # the secure aggregation is set up by BasicServer.iterate() for each round
+    if server.secure_aggregation is not None: return False
+    for method in ['run', 'iterate', 'communicate', 'communicate_with']:
+        if getattr(type(server), method) is not getattr(BasicServer, method): return False
+    for c in server.clients:
+        if type(c).reply is not BasicClient.reply or type(c).train is not BasicClient.train or c.privacy is not None: return False
+    return utils.functional.can_train_in_lockstep(server.model, server.clients[0].calculator, contexts[0].option['optimizer'])
+
+def run_seeds(option):
+    """
+    Run the configuration with each seed in option['seeds'].
+    :param
+        option: the options of the run, where option['seed'] is replaced by each seed
+    """
+    task_data = flw.load_task(option)
+    contexts = []
+    for seed in option['seeds']:
+        ctx = SeedContext(seed, dict(option, seed=seed))
+        flw.setup_seed(seed)
+        ctx.server = flw.initialize(ctx.option, task_data)
+        ctx.save()
+        contexts.append(ctx)
+    if can_run_in_lockstep(contexts):
+        run_in_lockstep(contexts)
+    else:
+        print("The algorithm can't be run in lockstep, and the seeds will be run one after another.")
+        for ctx in contexts:
+            with ctx.activated():
+                ctx.server.run()
+    return
+
+def run_in_lockstep(contexts):
+    """Run the federated systems round by round as BasicServer.run() does, where the local training is executed in lockstep."""
+    for ctx in contexts:
+        with ctx.activated():
+            flw.logger.time_start('Total Time Cost')
+    for round in range(contexts[0].server.num_rounds + 1):
+        print("--------------Round {}--------------".format(round))
+        # evaluate the global models and send them to the selected clients
+        clients, models, owners = [], [], []
+        for ctx in contexts:
+            with ctx.activated():
+                server = ctx.server
+                server.current_round = round
+                flw.logger.time_start('Time Cost')
+                if flw.logger.check_if_log(round, server.eval_interval):
+                    flw.logger.time_start('Eval Time Cost')
+                    flw.logger.log(server, current_round=round)
+                    flw.logger.time_end('Eval Time Cost')
+                for cid in ns.drop_overdue_clients(server, server.sample()):
+                    clients.append(server.clients[cid])
+                    models.append(server.clients[cid].unpack(server.pack(cid)))
+                    owners.append(ctx)
+        # the batches of each system are drawn under its own random states
+        def draw_batches(active):
+            batches = [None for _ in clients]
+            for ctx in contexts:
+                with ctx.activated():
+                    for k in range(len(clients)):
+                        if owners[k] is ctx and active[k]: batches[k] = clients[k].get_batch_data()
+            return batches
+        if models: utils.functional.train_in_lockstep(clients, models, draw_batches)
+        # aggregate the locally trained models
+        for ctx in contexts:
+            with ctx.activated():
+                server = ctx.server
+                received = server.unpack([c.pack(m) for c, m, owner in zip(clients, models, owners) if owner is ctx])
+                server.model = server.aggregate(received['model'], p=[1.0 * server.client_vols[cid] / server.data_vol for cid in server.selected_clients])
+                server.global_lr_scheduler(round)
+                flw.logger.time_end('Time Cost')
+    print("=================End==================")
+    for ctx in contexts:
+        with ctx.activated():
+            flw.logger.time_end('Total Time Cost')
+            flw.logger.save(os.path.join('fedtask', ctx.option['task'], 'record', flw.output_filename(ctx.option, ctx.server)))
+    return
@@ -27,12 +27,15 @@ def with_accessibility(sample):
         return selected_clients
     return sample_with_active
 
+def drop_overdue_clients(server, selected_clients):
+    client_latencies = [server.clients[cid].get_network_latency() for cid in selected_clients]
+    # drop clients whose latency > the upper bound of waiting time
+    server.selected_clients = [selected_clients[i] for i in range(len(selected_clients)) if client_latencies[i]<=server.TIME_LATENCY_BOUND]
+    time_sync = min(max(client_latencies), server.TIME_LATENCY_BOUND)
+    server.virtual_clock['time_sync'].append(time_sync)
+    return server.selected_clients
+
 def with_latency(communicate):
     def communicate_under_network_latency(self, selected_clients):
-        client_latencies = [self.clients[cid].get_network_latency() for cid in selected_clients]
-        # drop clients whose latency > the upper bound of waiting time
-        self.selected_clients = [selected_clients[i] for i in range(len(selected_clients)) if client_latencies[i]<=self.TIME_LATENCY_BOUND]
-        time_sync = min(max(client_latencies), self.TIME_LATENCY_BOUND)
-        self.virtual_clock['time_sync'].append(time_sync)
-        return communicate(self, self.selected_clients)
+        return communicate(self, drop_overdue_clients(self, selected_clients))
     return communicate_under_network_latency
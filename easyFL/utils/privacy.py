@@ -0,0 +1,128 @@
+"""This module is designed for the differentially private local training (DP-SGD, Abadi et al. 2016) of the
+clients. Each step of DPSGD is executed as:
+    1. compute the per-sample gradients of the batch by torch.func.vmap(torch.func.grad(loss)), where the loss of
+       each sample is computed by TaskCalculator.functional_loss(model, params, sample, mask)
+    2. clip the per-sample gradients to the norm max_grad_norm and sum them, add the Gaussian noise of
+       std noise_multiplier * max_grad_norm and divide the result by the batch size
+    3. write the result into the .grad of the parameters, so that the optimizer of the client updates the model
+The privacy loss of each client is tracked by an RDP accountant of the sampled Gaussian mechanism (Mironov et al.
+2019), where the sampling rate of each step is batch_size / the size of the local training data. The batches are
+drawn by shuffling instead of Poisson sampling as most implementations (e.g. Opacus) do in practice, and only the
+integer RDP orders are used, which gives a slightly looser epsilon than the fractional orders.
+The models with buffers (e.g. BatchNorm) are not supported since their per-sample gradients are not well defined.
+"""
+import math
+import torch
+
+DEFAULT_ORDERS = list(range(2, 64)) + [128, 256, 512]
+
+def _log_add(logx, logy):
+    a, b = min(logx, logy), max(logx, logy)
+    if a == -math.inf: return b
+    return math.log1p(math.exp(a - b)) + b
+
+def _log_binom(n, k):
+    return math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+
+def _compute_log_a(q, sigma, alpha):
+    """log(A_alpha) of the sampled Gaussian mechanism for an integer order alpha"""
+    log_a = -math.inf
+    for i in range(alpha + 1):
+        log_coef_i = _log_binom(alpha, i) + i * math.log(q) + (alpha - i) * math.log(1 - q)
+        log_a = _log_add(log_a, log_coef_i + (i * i - i) / (2 * sigma ** 2))
+    return log_a
+
+def compute_rdp(q, noise_multiplier, steps, orders=DEFAULT_ORDERS):
+    """
+    Compute the RDP of the sampled Gaussian mechanism repeated for steps times.
+    :param
+        q: the sampling rate
+        noise_multiplier: the ratio of the std of the noise to the sensitivity
+        steps: the number of steps
+        orders: the integer RDP orders
+    :return
+        a list of the RDP at each order
+    """
+    res = []
+    for alpha in orders:
+        if q == 0: rdp = 0.0
+        elif noise_multiplier == 0: rdp = math.inf
+        elif q == 1.0: rdp = alpha / (2 * noise_multiplier ** 2)
+        else: rdp = _compute_log_a(q, noise_multiplier, alpha) / (alpha - 1)
+        res.append(rdp * steps)
+    return res
+
+def get_epsilon(rdp, delta, orders=DEFAULT_ORDERS):
+    """Convert the RDP into (epsilon, delta)-DP by the conversion of Balle et al. 2020 and return the best epsilon"""
+    eps = [r - (math.log(delta) + math.log(a)) / (a - 1) + math.log((a - 1) / a) for r, a in zip(rdp, orders)]
+    return max(min(eps), 0.0)
+
+class RDPAccountant:
+    def __init__(self, orders=DEFAULT_ORDERS):
+        self.orders = orders
+        # [(noise_multiplier, sample_rate, steps)], where the consecutive steps of the same mechanism are merged
+        self.history = []
+
+    def step(self, noise_multiplier, sample_rate):
+        if self.history and self.history[-1][:2] == (noise_multiplier, sample_rate):
+            self.history[-1] = (noise_multiplier, sample_rate, self.history[-1][2] + 1)
+        else:
+            self.history.append((noise_multiplier, sample_rate, 1))
+
+    def get_epsilon(self, delta):
+        if not self.history: return 0.0
+        rdp = [0.0 for _ in self.orders]
+        for noise_multiplier, sample_rate, steps in self.history:
+            rdp = [r + s for r, s in zip(rdp, compute_rdp(sample_rate, noise_multiplier, steps, self.orders))]
+        return get_epsilon(rdp, delta, self.orders)
+
+def _map(batch, func):
+    if isinstance(batch, torch.Tensor): return func(batch)
+    return type(batch)([_map(b, func) for b in batch])
+
+class DPSGD:
+    def __init__(self, calculator, noise_multiplier=1.0, max_grad_norm=1.0, sample_rate=0.01):
+        """
+        :param
+            calculator: the task calculator of the client
+            noise_multiplier: the ratio of the std of the noise to max_grad_norm
+            max_grad_norm: the norm that each per-sample gradient is clipped to
+            sample_rate: the ratio of the batch size to the size of the local training data
+        """
+        self.calculator = calculator
+        self.noise_multiplier = noise_multiplier
+        self.max_grad_norm = max_grad_norm
+        self.sample_rate = sample_rate
+        self.accountant = RDPAccountant()
+
+    @staticmethod
+    def check_model(model):
+        """Check once before training that the per-sample gradients of the model are well defined"""
+        if len(list(model.buffers())) > 0:
+            raise RuntimeError("DP-SGD doesn't support the models with buffers (e.g. BatchNorm).")
+
+    def compute_grads(self, model, batch_data):
+        """Write the clipped and noised gradient of the batch into the .grad of the parameters of the model"""
+        names = [n for n, p in model.named_parameters() if p.requires_grad]
+        params = {n: p.detach() for n, p in model.named_parameters() if p.requires_grad}
+        data = self.calculator.data_to_device(batch_data, train=True)
+
+        def sample_loss(p, sample):
+            # each sample is computed as a batch of size 1
+            sample = _map(sample, lambda t: t.unsqueeze(0))
+            return self.calculator.functional_loss(model, p, sample, torch.ones(1, device=next(iter(p.values())).device))
+        per_sample_grads = torch.func.vmap(torch.func.grad(sample_loss), in_dims=(None, 0), randomness='different')(params, data)
+        # clip the per-sample gradients by their norms over all the parameters
+        norms = torch.stack([per_sample_grads[n].flatten(1).norm(dim=1) for n in names], dim=1).norm(dim=1)
+        factors = (self.max_grad_norm / (norms + 1e-6)).clamp(max=1.0)
+        batch_size = len(factors)
+        std = self.noise_multiplier * self.max_grad_norm
+        for n, p in model.named_parameters():
+            if n not in per_sample_grads: continue
+            g = torch.tensordot(factors, per_sample_grads[n], dims=1)
+            if std > 0: g.add_(torch.randn_like(g), alpha=std)
+            p.grad = g.div_(batch_size)
+        self.accountant.step(self.noise_multiplier, self.sample_rate)
+
+    def get_epsilon(self, delta):
+        return self.accountant.get_epsilon(delta)
@@ -0,0 +1,71 @@
+"""This module is designed for profiling a window of communication rounds, which excludes the
+cost of loading the fedtask and initializing the system from the reports. Two profilers can be
+enabled for each round in the window:
+    1. torch: torch.profiler with CPU (and CUDA if available) activities, memory and input shapes,
+       which reports the hot operators (e.g. the ones called by fmodule and the task calculators)
+    2. cprofile: the python-level cProfile, which reports the hot python functions
+The reports of each round are written into the directory 'record/profile' of the fedtask.
+"""
+import cProfile
+import io
+import os
+import pstats
+import torch
+
+class RoundProfiler:
+    def __init__(self, rounds=None, profiler='both', record_dir='.', prefix=''):
+        """
+        :param
+            rounds: [start, end] that specifies the window of rounds to be profiled (both included), and the profiler is disabled if it's empty
+            profiler: 'torch', 'cprofile' or 'both'
+            record_dir: the directory to write the reports
+            prefix: the prefix of the filenames of reports
+        """
+        self.rounds = list(rounds) if rounds else []
+        self.use_torch = profiler in ['torch', 'both']
+        self.use_cprofile = profiler in ['cprofile', 'both']
+        self.profile_dir = os.path.join(record_dir, 'profile')
+        self.prefix = prefix
+        self.torch_prof = None
+        self.c_prof = None
+
+    def is_profiled(self, round):
+        return len(self.rounds) == 2 and self.rounds[0] <= round <= self.rounds[1]
+
+    def start(self, round):
+        """Start profiling the round if it's in the window"""
+        if not self.is_profiled(round): return
+        if self.use_torch:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available(): activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.torch_prof = torch.profiler.profile(activities=activities, profile_memory=True, record_shapes=True)
+            self.torch_prof.__enter__()
+        if self.use_cprofile:
+            self.c_prof = cProfile.Profile()
+            self.c_prof.enable()
+
+    def end(self, round):
+        """Stop profiling the round and write its reports"""
+        if not self.is_profiled(round): return
+        if not os.path.exists(self.profile_dir): os.makedirs(self.profile_dir)
+        filename = os.path.join(self.profile_dir, '{}R{}'.format(self.prefix, round))
+        if self.c_prof is not None:
+            self.c_prof.disable()
+            self.c_prof.dump_stats(filename + '.prof')
+            s = io.StringIO()
+            pstats.Stats(self.c_prof, stream=s).sort_stats('cumulative').print_stats(50)
+            with open(filename + '_cprofile.txt', 'w') as outf:
+                outf.write(s.getvalue())
+            self.c_prof = None
+        if self.torch_prof is not None:
+            self.torch_prof.__exit__(None, None, None)
+            sort_by = 'cuda_time_total' if torch.cuda.is_available() else 'cpu_time_total'
+            with open(filename + '_torch.txt', 'w') as outf:
+                outf.write(self.torch_prof.key_averages().table(sort_by=sort_by, row_limit=50))
+                outf.write('\n')
+                outf.write(self.torch_prof.key_averages(group_by_input_shape=True).table(sort_by=sort_by, row_limit=50))
+                outf.write('\n')
+                outf.write(self.torch_prof.key_averages().table(sort_by='self_cpu_memory_usage', row_limit=50))
+            self.torch_prof.export_chrome_trace(filename + '_torch.json')
+            self.torch_prof = None
+        print("Profiling reports of round {} saved to {}".format(round, self.profile_dir))
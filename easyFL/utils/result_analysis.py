@@ -17,18 +17,46 @@ AC: the active rate of clients
 # matplotlib.rcParams['pdf.fonttype'] = 42
 # matplotlib.rcParams['ps.fonttype'] = 42
 
-import matplotlib.font_manager
-from matplotlib import rc
-#rc('font',**{'family':'sans-serif','sans-serif':['Helvetica']})
-
-
-rc('font', **{'family': 'Times New Roman', 'serif': ['CMU Serif']})
-rc('text')
-import matplotlib.pyplot as plt
+import ast
 import json
 import prettytable as pt
 import os
 import numpy as np
+try:
+    from utils.result_store import ResultStore, Compare, DB_NAME
+except ImportError:
+    # running in the directory utils
+    from result_store import ResultStore, Compare, DB_NAME
+
+# the abbreviations of the options in the names of records
+option_abbreviations = {
+    'M': 'model',
+    'R': 'num_rounds',
+    'B': 'batch_size',
+    'E': 'num_epochs',
+    'NS': 'num_steps',
+    'LR': 'learning_rate',
+    'P': 'proportion',
+    'S': 'seed',
+    'WD': 'weight_decay',
+    'DR': 'net_drop',
+    'AC': 'net_active',
+}
+
+_plt = None
+
+def get_pyplot():
+    """Import matplotlib and set the fonts only when drawing, since the font managers are slow to be loaded"""
+    global _plt
+    if _plt is None:
+        import matplotlib.font_manager
+        from matplotlib import rc
+        #rc('font',**{'family':'sans-serif','sans-serif':['Helvetica']})
+        rc('font', **{'family': 'Times New Roman', 'serif': ['CMU Serif']})
+        rc('text')
+        import matplotlib.pyplot as plt
+        _plt = plt
+    return _plt
 
 def read_data_into_dicts(task, records):
     path = '../fedtask/'+task+'/record'
@@ -58,6 +86,7 @@ def smooth(scalars, weight):  # Weight between 0 and 1
 
 def draw_curve(dicts, curve='train_loss', legends = [], final_round = -1):
     # plt.figure(figsize=(100,100), dpi=100)
+    plt = get_pyplot()
     print(legends)
     def removee(elem):
         a_string = elem
@@ -152,6 +181,62 @@ def scan_records(task, header = '', filter = {}):
     files = [f for f in files if f.startswith(header+'_') and f.endswith('.json')]
     return filename_filter(files, filter)
 
+# the stores opened by this process, whose records are imported when they are opened for the first time
+_stores = {}
+
+def open_store(task):
+    """Open the result store of the task, where the records that are not in the store are imported once"""
+    if task not in _stores:
+        path = '../fedtask/' + task + '/record'
+        _stores[task] = ResultStore(os.path.join(path, DB_NAME))
+        _stores[task].import_records(path)
+    return _stores[task]
+
+def refresh_store(task):
+    """Import the records that are written into the record directory after the store was opened"""
+    return open_store(task).import_records('../fedtask/' + task + '/record')
+
+def parse_condition(con):
+    """Parse a condition of the filter into a value, a list of values or a Compare (e.g. '>0.1', '<=5')"""
+    if not isinstance(con, str): return con
+    con = con.strip()
+    for op in Compare.OPERATORS:
+        if con.startswith(op):
+            return Compare(op, parse_condition(con[len(op):]))
+    try:
+        return ast.literal_eval(con)
+    except (ValueError, SyntaxError):
+        return con
+
+def read_store(task, header = '', filter = {}):
+    """
+    Query the records from the result store of the task, which works like scan_records() + read_data_into_dicts().
+    :param
+        task: the name of the fedtask
+        header: the name of the algorithm
+        filter: {option: condition}, where the option can be the abbreviation in the names of records (e.g. 'LR')
+                and the condition can be a value (e.g. '0.1'), a list of values (e.g. '[0.1, 0.05]') or a comparison
+                (e.g. '>0.1', '<=5'). The keys that are not options (e.g. the parameters of the algorithms in the
+                names of records) are matched against the names of the records as filename_filter() does.
+    :return
+        records, dicts
+    """
+    store = open_store(task)
+    columns = set(store.option_columns())
+    conditions, name_filter = {}, {}
+    if header: conditions['algorithm'] = header
+    for key, con in filter.items():
+        if option_abbreviations.get(key, key) in columns:
+            conditions[option_abbreviations.get(key, key)] = parse_condition(con)
+        else:
+            name_filter[key] = con
+    runs = store.query_runs(**conditions)
+    if name_filter:
+        records = set(filename_filter([r['record'] for r in runs], name_filter))
+        runs = [r for r in runs if r['record'] in records]
+    dicts = store.load_outputs(runs)
+    return [r['record'] for r in runs], dicts
+
 def print_table(records, dicts):
     tb = pt.PrettyTable()
     tb.field_names = [
@@ -227,13 +312,12 @@ if __name__ == '__main__':
         'z': '2',
         #'B':'16.0',
     }
-    # read and filter the filenames
-    records = set()
+    # query the records from the result store
+    records, dicts = [], []
     for h in headers:
-        records = records.union(set(scan_records(task, h, flt)))
-    records = list(records)
-    # read the selected files into dicts
-    dicts = read_data_into_dicts(task, records)
+        recs, ds = read_store(task, h, flt)
+        records.extend(recs)
+        dicts.extend(ds)
 
     # print table
     print_table(records, dicts)
@@ -251,6 +335,7 @@ if __name__ == '__main__':
     #legends = create_legend(records, ['B','LR','NS', 'E'])
     legends = create_legend(records, [''])
     i=0
+    plt = get_pyplot()
     for curve in curve_names:
 
         plt.figure(i)
@@ -0,0 +1,180 @@
+"""This module is designed for storing the results of runs into an append-only SQLite database, so that
+thousands of runs can be analysed without listing the record directory and parsing each record. The
+database 'results.db' lies in the record directory of each fedtask and contains three tables:
+    runs:       one row for each run, which has the name of its record, the time it's saved and one
+                (indexed) column for each option in its meta (the columns are added when new options appear)
+    metrics:    (run_id, name, step, value) for each scalar metric, where step is the position of the value
+                in the list of the metric (i.e. the round is step*eval_interval for the evaluated metrics)
+    extras:     (run_id, name, value) for the other outputs (e.g. the trace), where value is JSON
+Example:
+    store = ResultStore('fedtask/mnist_classification_cnum100_dist0_skew0_seed0/record/results.db')
+    runs = store.query_runs(algorithm='fedavg', learning_rate=[0.1, 0.05])
+    metrics = store.load_metrics([r['run_id'] for r in runs], names=['test_accuracy'])
+"""
+import numbers
+import os
+import sqlite3
+import time
+import ujson
+
+DB_NAME = 'results.db'
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _to_column_value(value):
+    """Options that are not scalars (e.g. lists) are saved as JSON"""
+    if value is None or isinstance(value, (bool, numbers.Number, str)):
+        return value
+    return ujson.dumps(value)
+
+class Compare:
+    """A comparison condition of query_runs(), e.g. learning_rate=Compare('>', 0.01)"""
+    OPERATORS = ['<=', '>=', '!=', '==', '<', '>']
+
+    def __init__(self, op, value):
+        if op not in self.OPERATORS:
+            raise RuntimeError("Unknown comparison operator '{}'.".format(op))
+        self.op = op
+        self.value = value
+
+class ResultStore:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        # the runs of concurrent processes (e.g. sweep.py) wait for the lock of the database
+        self.conn = sqlite3.connect(filepath, timeout=60)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, record TEXT, created REAL)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS metrics (run_id INTEGER, name TEXT, step INTEGER, value REAL)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS extras (run_id INTEGER, name TEXT, value TEXT)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_runs_record ON runs (record)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_metrics_run_name ON metrics (run_id, name)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_extras_run_name ON extras (run_id, name)')
+
+    def close(self):
+        self.conn.close()
+
+    def option_columns(self):
+        return [row['name'] for row in self.conn.execute('PRAGMA table_info(runs)') if row['name'] not in ['run_id', 'record', 'created']]
+
+    def _add_option_columns(self, names):
+        existing = set(self.option_columns())
+        for name in names:
+            if name in existing: continue
+            self.conn.execute('ALTER TABLE runs ADD COLUMN {}'.format(_quote(name)))
+            self.conn.execute('CREATE INDEX IF NOT EXISTS {} ON runs ({})'.format(_quote('idx_runs_' + name), _quote(name)))
+
+    def add_run(self, record, output):
+        """
+        Append a run into the store.
+        :param
+            record: the name of the record of the run (i.e. flw.output_filename())
+            output: the output of the logger, where output['meta'] is the options of the run
+        :return
+            the id of the run
+        """
+        meta = output.get('meta', {})
+        with self.conn:
+            self._add_option_columns(list(meta.keys()))
+            columns = ['record', 'created'] + list(meta.keys())
+            values = [record, time.time()] + [_to_column_value(v) for v in meta.values()]
+            cursor = self.conn.execute('INSERT INTO runs ({}) VALUES ({})'.format(','.join([_quote(c) for c in columns]), ','.join(['?'] * len(columns))), values)
+            run_id = cursor.lastrowid
+            metric_rows, extra_rows = [], []
+            for name, value in output.items():
+                if name == 'meta': continue
+                if isinstance(value, list) and all([isinstance(v, numbers.Number) and not isinstance(v, bool) for v in value]):
+                    metric_rows.extend([(run_id, name, step, float(v)) for step, v in enumerate(value)])
+                else:
+                    extra_rows.append((run_id, name, ujson.dumps(value)))
+            self.conn.executemany('INSERT INTO metrics (run_id, name, step, value) VALUES (?,?,?,?)', metric_rows)
+            self.conn.executemany('INSERT INTO extras (run_id, name, value) VALUES (?,?,?)', extra_rows)
+        return run_id
+
+    def query_runs(self, latest=True, **conditions):
+        """
+        Query the runs by their options.
+        :param
+            latest: only return the latest run of each record if True
+            conditions: option=value (e.g. algorithm='fedavg'), option=[values] (e.g. seed=[0, 1]) or
+                        option=Compare(op, value) (e.g. learning_rate=Compare('>', 0.01))
+        :return
+            a list of dicts that contain the run_id, the record and the options of the runs
+        """
+        columns = set(self.option_columns())
+        clauses, params = [], []
+        for key, value in conditions.items():
+            if key not in columns:
+                raise RuntimeError("Unknown option '{}' in the result store.".format(key))
+            if isinstance(value, Compare):
+                clauses.append('{} {} ?'.format(_quote(key), '=' if value.op == '==' else value.op))
+                params.append(_to_column_value(value.value))
+            elif isinstance(value, (list, tuple, set)):
+                clauses.append('{} IN ({})'.format(_quote(key), ','.join(['?'] * len(value))))
+                params.extend([_to_column_value(v) for v in value])
+            else:
+                clauses.append('{} = ?'.format(_quote(key)))
+                params.append(_to_column_value(value))
+        sql = 'SELECT * FROM runs'
+        if clauses: sql += ' WHERE ' + ' AND '.join(clauses)
+        if latest: sql += ' AND ' if clauses else ' WHERE '
+        if latest: sql += 'run_id IN (SELECT MAX(run_id) FROM runs GROUP BY record)'
+        return [dict(row) for row in self.conn.execute(sql + ' ORDER BY run_id', params)]
+
+    def load_metrics(self, run_ids, names=None):
+        """
+        Load the metrics of the runs.
+        :param
+            run_ids: the ids of the runs
+            names: the names of the metrics to be loaded, and all the metrics are loaded if it's None
+        :return
+            a dict {run_id: {name: [values ordered by step]}}
+        """
+        res = {rid: {} for rid in run_ids}
+        if not run_ids: return res
+        sql = 'SELECT run_id, name, value FROM metrics WHERE run_id IN ({})'.format(','.join(['?'] * len(run_ids)))
+        params = list(run_ids)
+        if names:
+            sql += ' AND name IN ({})'.format(','.join(['?'] * len(names)))
+            params.extend(names)
+        for row in self.conn.execute(sql + ' ORDER BY run_id, name, step', params):
+            res[row['run_id']].setdefault(row['name'], []).append(row['value'])
+        return res
+
+    def load_extras(self, run_ids, names=None):
+        """Load the non-scalar outputs of the runs as {run_id: {name: value}}"""
+        res = {rid: {} for rid in run_ids}
+        if not run_ids: return res
+        sql = 'SELECT run_id, name, value FROM extras WHERE run_id IN ({})'.format(','.join(['?'] * len(run_ids)))
+        params = list(run_ids)
+        if names:
+            sql += ' AND name IN ({})'.format(','.join(['?'] * len(names)))
+            params.extend(names)
+        for row in self.conn.execute(sql, params):
+            res[row['run_id']][row['name']] = ujson.loads(row['value'])
+        return res
+
+    def load_outputs(self, runs, names=None):
+        """Rebuild the outputs of the logger (i.e. the contents of the records) of the runs returned by query_runs()"""
+        run_ids = [r['run_id'] for r in runs]
+        metrics = self.load_metrics(run_ids, names)
+        extras = self.load_extras(run_ids, names)
+        res = []
+        for r in runs:
+            output = {'meta': {k: v for k, v in r.items() if k not in ['run_id', 'record', 'created'] and v is not None}}
+            output.update(metrics[r['run_id']])
+            output.update(extras[r['run_id']])
+            res.append(output)
+        return res
+
+    def import_records(self, record_dir):
+        """Import the .json records in record_dir that are not in the store yet"""
+        existing = set([row['record'] for row in self.conn.execute('SELECT DISTINCT record FROM runs')])
+        num_imported = 0
+        for f in sorted(os.listdir(record_dir)):
+            if not f.endswith('.json') or f in existing: continue
+            with open(os.path.join(record_dir, f), 'r') as inf:
+                self.add_run(f, ujson.load(inf))
+            num_imported += 1
+        return num_imported
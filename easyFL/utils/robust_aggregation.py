@@ -0,0 +1,110 @@
+"""This module is designed for the Byzantine-robust aggregation of the local models, where each rule works on the
+K x d matrix stacked by the flattened models of the K clients:
+    median: the coordinate-wise median (Yin et al. 2018), computed by torch.quantile in chunks of columns
+    trimmed_mean: the coordinate-wise mean after removing the f largest and the f smallest values (Yin et al. 2018)
+    krum: the model with the smallest sum of the squared distances to its K-f-2 nearest neighbours (Blanchard et al. 2017)
+    multi_krum: the average of the K-f models with the smallest Krum scores
+    geometric_median: the weighted geometric median by the smoothed Weiszfeld algorithm (Pillutla et al. 2019)
+where f = floor(byzantine_ratio * K). The pairwise distances of Krum are computed from a single Gram matrix of the
+centered models. The floating-point buffers (e.g. the statistics of BatchNorm) are aggregated by the same rule as the
+parameters.
+"""
+import copy
+import torch
+
+RULES = ['median', 'trimmed_mean', 'krum', 'multi_krum', 'geometric_median']
+# the maximal number of the elements of each chunk of columns for median and trimmed_mean
+CHUNK_SIZE = 1 << 22
+
+def _flat_tensors(model):
+    return [t for t in model.state_dict().values() if t.is_floating_point()]
+
+def stack_models(models):
+    """Flatten each model into a row of the K x d matrix"""
+    return torch.stack([torch.cat([t.reshape(-1) for t in _flat_tensors(m)]) for m in models])
+
+def unflatten(model, vector):
+    """Create a copy of model whose floating-point parameters and buffers are loaded from the vector"""
+    res = copy.deepcopy(model)
+    beg = 0
+    with torch.no_grad():
+        for t in _flat_tensors(res):
+            end = beg + t.numel()
+            t.copy_(vector[beg:end].view_as(t))
+            beg = end
+    return res
+
+def _column_chunks(X):
+    step = max(CHUNK_SIZE // X.shape[0], 1)
+    for beg in range(0, X.shape[1], step):
+        yield X[:, beg:beg + step]
+
+def coordinate_median(X):
+    return torch.cat([torch.quantile(chunk, 0.5, dim=0) for chunk in _column_chunks(X)])
+
+def trimmed_mean(X, f):
+    K = X.shape[0]
+    f = min(f, (K - 1) // 2)
+    if f == 0: return X.mean(dim=0)
+    return torch.cat([chunk.sort(dim=0)[0][f:K - f].mean(dim=0) for chunk in _column_chunks(X)])
+
+def pairwise_sq_distances(X):
+    """The K x K matrix of the squared distances computed by ||xi||^2 + ||xj||^2 - 2<xi, xj> of the centered rows"""
+    Xc = X - X.mean(dim=0, keepdim=True)
+    G = Xc @ Xc.T
+    sq = G.diagonal()
+    return (sq[:, None] + sq[None, :] - 2 * G).clamp_(min=0)
+
+def krum_scores(X, f):
+    K = X.shape[0]
+    D = pairwise_sq_distances(X)
+    # the K-f-2 nearest neighbours exclude the model itself, whose distance is the smallest (i.e. zero)
+    n = min(max(K - f - 2, 1), K - 1)
+    return D.sort(dim=1)[0][:, 1:n + 1].sum(dim=1)
+
+def multi_krum(X, f, m):
+    if X.shape[0] <= 2: return X.mean(dim=0)
+    idx = krum_scores(X, f).argsort()[:m]
+    return X[idx].mean(dim=0)
+
+def geometric_median(X, weights, max_iter=100, eps=1e-6, tol=1e-5):
+    weights = weights / weights.sum()
+    z = (weights[:, None] * X).sum(dim=0)
+    for _ in range(max_iter):
+        beta = weights / (X - z).norm(dim=1).clamp(min=eps)
+        new_z = (beta[:, None] * X).sum(dim=0) / beta.sum()
+        if (new_z - z).norm() <= tol * z.norm().clamp(min=eps):
+            z = new_z
+            break
+        z = new_z
+    return z
+
+def aggregate(rule, model, models, p=[], byzantine_ratio=0.1):
+    """
+    Aggregate the local models by a robust rule.
+    :param
+        rule: the name of the rule in RULES
+        model: the global model, whose structure is used to create the result
+        models: a list of local models
+        p: a list of weights for aggregating, which is only used by geometric_median
+        byzantine_ratio: the assumed ratio of the malicious clients among the K clients
+    :return
+        the aggregated model
+    """
+    X = stack_models(models)
+    K = X.shape[0]
+    f = int(byzantine_ratio * K)
+    if rule == 'median':
+        res = coordinate_median(X)
+    elif rule == 'trimmed_mean':
+        res = trimmed_mean(X, f)
+    elif rule == 'krum':
+        res = multi_krum(X, f, 1)
+    elif rule == 'multi_krum':
+        res = multi_krum(X, f, max(K - f, 1))
+    elif rule == 'geometric_median':
+        weights = torch.tensor(p[:K], dtype=X.dtype, device=X.device) if len(p) >= K else torch.ones(K, dtype=X.dtype, device=X.device)
+        res = geometric_median(X, weights)
+    else:
+        raise RuntimeError("Unknown robust aggregation rule {}.".format(rule))
+    return unflatten(model, res)
@@ -0,0 +1,104 @@
+"""This module is designed for sampling the clients in O(K) per round, where K is the number of the sampled clients,
+so that the sampling doesn't depend on the size N of the population:
+    1. sampling with replacement by the weights (e.g. md) draws from an alias table (Vose 1991), which is built in
+       O(N) once and rebuilt only when the weights change, and each draw costs a randint and a rand
+    2. sampling without replacement uniformly (e.g. uniform) is done by Floyd's algorithm in O(K)
+    3. availability-filtered sampling rejects the drawn clients that are not available (accept(cid) is False), whose
+       expected cost is O(K / the ratio of the available weight)
+The random numbers are drawn from numpy.random, so that the sampling is reproduced by the seed of the run.
+"""
+import numpy as np
+
+class AliasTable:
+    def __init__(self, weights):
+        """
+        :param
+            weights: the nonnegative weights of the N items, which are normalized into probabilities
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        total = weights.sum()
+        if len(weights) == 0 or total <= 0:
+            raise RuntimeError("The weights of the alias table should contain a positive value.")
+        n = len(weights)
+        scaled = weights * n / total
+        self.prob = np.ones(n, dtype=np.float64)
+        self.alias = np.arange(n, dtype=np.int64)
+        small = list(np.where(scaled < 1.0)[0])
+        large = list(np.where(scaled >= 1.0)[0])
+        # each small item is completed by a large item, which becomes small once its weight falls below 1
+        while small and large:
+            s, l = small.pop(), large[-1]
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            if scaled[l] < 1.0: small.append(large.pop())
+        self.n = n
+
+    def draw(self, k):
+        """Draw k items with replacement"""
+        idx = np.random.randint(self.n, size=k)
+        return np.where(np.random.rand(k) < self.prob[idx], idx, self.alias[idx])
+
+def floyd_sample(n, k):
+    """Draw k distinct items of range(n) uniformly (Floyd's algorithm)"""
+    selected = set()
+    res = []
+    for j in range(n - k, n):
+        t = np.random.randint(j + 1)
+        if t in selected: t = j
+        selected.add(t)
+        res.append(t)
+    return res
+
+class ClientSampler:
+    def __init__(self, weights=None):
+        """
+        :param
+            weights: the weights of the clients for the sampling with replacement (e.g. their data volumes)
+        """
+        self.weights = None
+        self.table = None
+        if weights is not None: self.set_weights(weights)
+
+    def set_weights(self, weights):
+        """Set new weights, whose alias table is built when it is used for the first time"""
+        self.weights = weights
+        self.table = None
+
+    def draw(self, k, accept=None, max_trials=100):
+        """
+        Draw k clients with replacement by the weights.
+        :param
+            k: the number of the clients
+            accept: a function cid -> bool that filters the available clients, or None
+            max_trials: the maximal number of the rounds of rejection, after which the remaining slots are filled
+                        without the filter
+        :return
+            a list of the ids of the clients
+        """
+        if self.table is None: self.table = AliasTable(self.weights)
+        if accept is None: return [int(cid) for cid in self.table.draw(k)]
+        res = []
+        for _ in range(max_trials):
+            res.extend([int(cid) for cid in self.table.draw(k - len(res)) if accept(cid)])
+            if len(res) == k: return res
+        return res + [int(cid) for cid in self.table.draw(k - len(res))]
+
+    def uniform(self, n, k, accept=None, max_trials=100):
+        """
+        Draw k distinct clients of range(n) uniformly, where the rejected ones are resampled among the others
+        and the remaining slots are filled by the rejected ones after max_trials * k trials.
+        """
+        res = floyd_sample(n, k)
+        if accept is None: return res
+        seen = set(res)
+        rejected = [cid for cid in res if not accept(cid)]
+        res = [cid for cid in res if cid not in rejected]
+        for _ in range(max_trials * k):
+            if len(res) == k or len(seen) == n: break
+            cid = int(np.random.randint(n))
+            if cid in seen: continue
+            seen.add(cid)
+            if accept(cid): res.append(cid)
+            else: rejected.append(cid)
+        return res + rejected[:k - len(res)]
@@ -0,0 +1,130 @@
+"""This module is designed for tracing where the time of each communication round goes.
+Instead of decorating the methods of BasicServer and BasicClient, the tracer wraps the
+bound methods of the server and the clients when initializing the federated system, so
+that the methods rewritten by each algorithm are traced as well. Each call of a traced
+method opens a span, and spans opened inside another one are nested into it:
+    server.iterate
+    ├─ server.sample
+    ├─ server.communicate
+    │  ├─ server.pack
+    │  └─ client.reply
+    │     ├─ client.unpack
+    │     ├─ client.train
+    │     └─ client.pack
+    │  └─ server.unpack
+    └─ server.aggregate
+The recorded spans can be summarized into per-phase statistics (see Tracer.summary()) and
+exported as a Chrome trace-event file that can be opened by chrome://tracing or Perfetto.
+"""
+import collections
+import functools
+import threading
+import time
+import numpy as np
+import ujson
+
+SERVER_PHASES = ['iterate', 'sample', 'communicate', 'pack', 'unpack', 'aggregate']
+CLIENT_PHASES = ['reply', 'unpack', 'train', 'pack']
+LOGGER_PHASES = ['log']
+
+class Tracer:
+    def __init__(self):
+        self.spans = []
+        self.server = None
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current_round(self):
+        return self.server.current_round if self.server is not None else -1
+
+    def trace(self, func, name, tid=0, **args):
+        """Wrap func so that each call of it is recorded as a span named 'name'"""
+        @functools.wraps(func)
+        def traced(*fargs, **fkwargs):
+            stack = self._stack()
+            span = {'name': name, 'round': self.current_round(), 'tid': tid, 'depth': len(stack), 'args': args}
+            stack.append(name)
+            start = time.perf_counter()
+            try:
+                return func(*fargs, **fkwargs)
+            finally:
+                span['ts'] = start - self._origin
+                span['dur'] = time.perf_counter() - start
+                stack.pop()
+                with self._lock:
+                    self.spans.append(span)
+        return traced
+
+    def instrument(self, server, logger=None):
+        """
+        Trace the phases of the server, its clients and the logger by replacing their methods
+        with the traced ones.
+        :param
+            server: the server of the federated system
+            logger: the logger whose method log() will be traced as the evaluating phase
+        """
+        self.server = server
+        for phase in SERVER_PHASES:
+            if hasattr(server, phase):
+                setattr(server, phase, self.trace(getattr(server, phase), 'server.' + phase))
+        for cid, c in enumerate(server.clients):
+            for phase in CLIENT_PHASES:
+                if hasattr(c, phase):
+                    setattr(c, phase, self.trace(getattr(c, phase), 'client.' + phase, tid=cid + 1, client=c.name))
+        if logger is not None:
+            for phase in LOGGER_PHASES:
+                setattr(logger, phase, self.trace(getattr(logger, phase), 'server.' + phase))
+        return
+
+    def summary(self):
+        """
+        Aggregate the recorded spans into statistics of each phase.
+        :return
+            a dict {phase: {'count', 'total', 'mean', 'std', 'min', 'max', 'rounds'}} where the durations
+            are measured in seconds and 'rounds' is the total time cost of the phase in each round.
+        """
+        durations = collections.defaultdict(list)
+        per_round = collections.defaultdict(lambda: collections.defaultdict(float))
+        for span in self.spans:
+            durations[span['name']].append(span['dur'])
+            per_round[span['name']][span['round']] += span['dur']
+        res = {}
+        for name, durs in durations.items():
+            res[name] = {
+                'count': len(durs),
+                'total': float(np.sum(durs)),
+                'mean': float(np.mean(durs)),
+                'std': float(np.std(durs)),
+                'min': float(np.min(durs)),
+                'max': float(np.max(durs)),
+                'rounds': [per_round[name][r] for r in sorted(per_round[name].keys())],
+            }
+        return res
+
+    def save(self, filepath):
+        """Save the recorded spans as a Chrome trace-event file"""
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': 0, 'args': {'name': 'server'}}]
+        if self.server is not None:
+            for cid, c in enumerate(self.server.clients):
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': cid + 1, 'args': {'name': c.name}})
+        for span in self.spans:
+            args = dict(span['args'])
+            args['round'] = span['round']
+            events.append({
+                'name': span['name'],
+                'cat': span['name'].split('.')[0],
+                'ph': 'X',
+                'pid': 0,
+                'tid': span['tid'],
+                'ts': span['ts'] * 1e6,
+                'dur': span['dur'] * 1e6,
+                'args': args,
+            })
+        with open(filepath, 'w') as outf:
+            ujson.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, outf)
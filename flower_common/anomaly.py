@@ -0,0 +1,124 @@
+# Anomaly scores of the updates of the clients, computed by the server as the replies of a round arrive
+#
+# For each reply the update u = (parameters of the client) - (global parameters) is scored by
+#     norm:             ||u||
+#     cosine:           the cosine similarity between u and the running mean of the updates of all the clients
+#     history_distance: ||u - h|| / ||h|| where h is the running mean of the previous updates of the same client
+# and each feature is turned into a z-score by the running mean and variance of the feature over the previous
+# replies (Welford), the anomaly score being the largest z-score. All the statistics are updated incrementally,
+# so the memory is O(d) for the running mean, O(d) per client for its history and O(1) for the features, and no
+# update is kept after it has been scored. The scores are logged per round, and the policy decides whether they
+# are only logged ("log"), used to down-weight the suspicious clients ("downweight") or to exclude them from the
+# aggregation ("exclude").
+#     strategy = AnomalyFedAvg(scorer=UpdateScorer(policy="exclude"), sink=sink, ...)
+
+import dataclasses
+import math
+import flwr as fl
+import numpy as np
+
+POLICIES = ["log", "downweight", "exclude"]
+FEATURES = ["norm", "cosine", "history_distance"]
+
+
+class RunningStat:
+    """The running mean and variance of a scalar (Welford)"""
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def zscore(self, x):
+        if self.count < 2: return 0.0
+        std = math.sqrt(self.m2 / (self.count - 1))
+        return (x - self.mean) / std if std > 0 else 0.0
+
+
+class UpdateScorer:
+    def __init__(self, policy="log", threshold=3.0, momentum=0.9, warmup=3):
+        """
+        policy: one of POLICIES
+        threshold: the anomaly score above which a client is down-weighted or excluded
+        momentum: the momentum of the running means of the updates
+        warmup: the number of replies that are scored before the scores are used
+        """
+        if policy not in POLICIES: raise RuntimeError("Unknown anomaly policy {}.".format(policy))
+        self.policy = policy
+        self.threshold = threshold
+        self.momentum = momentum
+        self.warmup = warmup
+        self.mean_update = None
+        self.history = {}
+        self.stats = {name: RunningStat() for name in FEATURES}
+        self.count = 0
+
+    def score(self, client, update):
+        """Score the flattened update of the client and then fold it into the running statistics"""
+        update = update.astype(np.float64)
+        norm = float(np.linalg.norm(update))
+        features = {"norm": norm, "cosine": 1.0, "history_distance": 0.0}
+        if self.mean_update is not None:
+            denominator = norm * np.linalg.norm(self.mean_update)
+            features["cosine"] = float(update @ self.mean_update / denominator) if denominator > 0 else 0.0
+        history = self.history.get(client)
+        if history is not None:
+            features["history_distance"] = float(np.linalg.norm(update - history) / max(np.linalg.norm(history), 1e-12))
+        # a large norm, a small cosine similarity or a large change from the client's history are suspicious
+        zscores = [self.stats["norm"].zscore(norm), -self.stats["cosine"].zscore(features["cosine"])]
+        if history is not None: zscores.append(self.stats["history_distance"].zscore(features["history_distance"]))
+        features["score"] = max(zscores) if self.count >= self.warmup else 0.0
+        # update the running statistics, where the anomalous updates are left out so that they don't shift them
+        self.count += 1
+        if features["score"] <= self.threshold:
+            self.stats["norm"].update(norm)
+            self.stats["cosine"].update(features["cosine"])
+            if history is not None: self.stats["history_distance"].update(features["history_distance"])
+            self.mean_update = update.copy() if self.mean_update is None else self.momentum * self.mean_update + (1 - self.momentum) * update
+            # the history of a client that turns malicious is kept as its last normal updates
+            self.history[client] = update.copy() if history is None else self.momentum * history + (1 - self.momentum) * update
+        return features
+
+    def weight(self, score):
+        """The factor of the aggregation weight of a client given its anomaly score"""
+        if self.policy == "log" or score <= self.threshold: return 1.0
+        if self.policy == "downweight": return self.threshold / score
+        return 0.0
+
+
+def flatten(weights):
+    return np.concatenate([np.asarray(w, dtype=np.float64).reshape(-1) for w in weights if np.issubdtype(np.asarray(w).dtype, np.floating)])
+
+
+class AnomalyFedAvg(fl.server.strategy.FedAvg):
+    """FedAvg whose fit results are scored by an UpdateScorer before the aggregation"""
+    def __init__(self, *args, scorer=None, sink=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scorer = scorer if scorer is not None else UpdateScorer()
+        self.sink = sink
+        self.global_weights = None
+
+    def configure_fit(self, rnd, parameters, client_manager):
+        # keep the global parameters sent to the clients, from which the updates are computed
+        self.global_weights = flatten(fl.common.parameters_to_weights(parameters))
+        return super().configure_fit(rnd, parameters, client_manager)
+
+    def aggregate_fit(self, rnd, results, failures):
+        kept = []
+        for proxy, fit_res in results:
+            client = fit_res.metrics.get("client", proxy.cid) if fit_res.metrics else proxy.cid
+            update = flatten(fl.common.parameters_to_weights(fit_res.parameters)) - self.global_weights
+            features = self.scorer.score(client, update)
+            weight = self.scorer.weight(features["score"])
+            if self.sink is not None:
+                self.sink.log(rnd, client, {"update_" + name: features[name] for name in FEATURES})
+                self.sink.log(rnd, client, {"anomaly_score": features["score"], "aggregation_weight": weight})
+            # FedAvg weights the clients by their numbers of examples, which are scaled without rounding so that
+            # the small clients are down-weighted instead of being excluded
+            if weight > 0: kept.append((proxy, dataclasses.replace(fit_res, num_examples=fit_res.num_examples * weight)))
+        return super().aggregate_fit(rnd, kept, failures)
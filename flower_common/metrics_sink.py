@@ -0,0 +1,74 @@
+# Per-round metrics of the Flower servers, shared by server_attack.py and server_clean.py
+#
+# The metrics are buffered in memory during a round and flushed by a single write at the end of the round into
+# <prefix>.bin, whose records are typed (round: int32, client: int32, metric: int32, value: float64), while the names
+# of the clients and the metrics are kept in <prefix>.json. The file is appended across runs as the old z*.csv were,
+# and read_metrics() reads it back as numpy arrays without any string parsing:
+#     metrics = read_metrics("metrics")
+#     rounds, values = select(metrics, "accuracy", client=CENTRALIZED)
+
+import json
+import os
+import threading
+import numpy as np
+
+RECORD = np.dtype([("round", "<i4"), ("client", "<i4"), ("metric", "<i4"), ("value", "<f8")])
+# the names of the "clients" of the metrics computed by the server
+CENTRALIZED = "<centralized>"
+WEIGHTED = "<weighted>"
+
+
+def _read_names(prefix):
+    if not os.path.exists(prefix + ".json"):
+        return {"clients": [], "metrics": []}
+    with open(prefix + ".json", "r") as inf:
+        return json.load(inf)
+
+
+class MetricsSink:
+    def __init__(self, prefix="metrics"):
+        self.prefix = prefix
+        self.names = _read_names(prefix)
+        self.ids = {key: {name: i for i, name in enumerate(names)} for key, names in self.names.items()}
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def _id(self, key, name):
+        ids = self.ids[key]
+        if name not in ids:
+            ids[name] = len(self.names[key])
+            self.names[key].append(name)
+        return ids[name]
+
+    def log(self, round, client, metrics):
+        """Buffer the metrics {name: value} of a client (or CENTRALIZED/WEIGHTED) at the round"""
+        with self.lock:
+            cid = self._id("clients", str(client))
+            for name, value in metrics.items():
+                self.rows.append((round, cid, self._id("metrics", name), float(value)))
+
+    def flush(self):
+        """Write the buffered metrics by a single write (and the names if new ones appeared)"""
+        with self.lock:
+            if not self.rows: return
+            with open(self.prefix + ".json", "w") as outf:
+                json.dump(self.names, outf)
+            with open(self.prefix + ".bin", "ab") as outf:
+                outf.write(np.array(self.rows, dtype=RECORD).tobytes())
+            self.rows = []
+
+
+def read_metrics(prefix="metrics"):
+    """Return {'round', 'client', 'metric', 'value'} as arrays and the names of the clients and the metrics"""
+    records = np.fromfile(prefix + ".bin", dtype=RECORD) if os.path.exists(prefix + ".bin") else np.zeros(0, dtype=RECORD)
+    res = {field: records[field] for field in RECORD.names}
+    res.update(_read_names(prefix))
+    return res
+
+
+def select(metrics, metric, client=None):
+    """Return the rounds and the values of a metric of a client (all clients if None), ordered as they were logged"""
+    mask = metrics["metric"] == metrics["metrics"].index(metric)
+    if client is not None:
+        mask &= metrics["client"] == metrics["clients"].index(client)
+    return metrics["round"][mask], metrics["value"][mask]
@@ -0,0 +1,211 @@
+# Federated clients of the pneumonia experiments (Flower), shared by "anomaly detection" and "differential privacy"
+#
+# The clients are described by a list of configurations (see clients.json in each experiment), e.g.
+#     {"name": "pn1", "train": "mydata/pn1/train", "test": "mydata/pneumonia/test"}
+#     {"name": "pn4", "train": "mydata/pn_old/pn4/train", "test": "mydata/pneumonia/test",
+#      "fake_train": "mydata/pn4_brain/train"}            # malicious: trains on fake_train when changing_train_loader=1
+#     {"name": "pn1", "train": "mydata/pn_old/pn1/train", "test": "mydata/pneumonia/test", "dp": true}
+# and all of them run as virtual clients inside one process: they share one model (which is loaded from the
+# parameters sent by the server before each fit/evaluate), the torch thread pools and the decoded image stores
+# (a folder is decoded once for all the clients that use it), and only one client computes at a time so that
+# the memory of a single model and a single training is needed. The clients with dp keep their own model, to
+# which their PrivacyEngine is attached. Each client still keeps its own gRPC connection (a thread that only
+# waits for the messages of the server), since the server is a separate process that samples the clients
+# among the connected ones.
+#
+# Usage (from the directory of the experiment, after starting its server):
+#     python clients.py                     # all the clients in clients.json
+#     python clients.py --clients pn4       # a single client (the same as python pn4_malicious.py)
+
+import argparse
+import json
+import os
+import threading
+import warnings
+from collections import OrderedDict
+import flwr as fl
+import torch
+import torch.nn as nn
+from tqdm import tqdm
+from easyFL.benchmark.xray import XRayStore, XRayLoader
+
+warnings.filterwarnings("ignore", category=UserWarning)
+DEVICE = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+PRIVACY_PARAMS = {
+    "target_delta": 0.001,
+    #"noise_multiplier": 5.0,
+    "target_epsilon": 5.0,
+    "max_grad_norm": 1.0,
+}
+
+
+class Net(nn.Module):
+    def __init__(self):
+        super(Net, self).__init__()
+        self.conv_a = nn.Conv2d(in_channels=3, out_channels=12, kernel_size=3, stride=1, padding=1)
+        self.batch_a = nn.BatchNorm2d(num_features=12)
+        self.relu_a = nn.ReLU()
+        self.max_a = nn.MaxPool2d(kernel_size=2)
+        self.conv_b = nn.Conv2d(in_channels=12, out_channels=20, kernel_size=3, stride=1, padding=1)
+        self.relu_b = nn.ReLU()
+        self.conv_c = nn.Conv2d(in_channels=20, out_channels=32, kernel_size=3, stride=1, padding=1)
+        self.batch_b = nn.BatchNorm2d(num_features=32)
+        self.relu_c = nn.ReLU()
+        self.fc = nn.Linear(in_features=32 * 112 * 112, out_features=2)
+
+    def forward(self, input):
+        output = self.conv_a(input)
+        output = self.batch_a(output)
+        output = self.relu_a(output)
+        output = self.max_a(output)
+        output = self.conv_b(output)
+        output = self.relu_b(output)
+        output = self.conv_c(output)
+        output = self.batch_b(output)
+        output = self.relu_c(output)
+        output = output.view(-1, 32 * 112 * 112)
+        output = self.fc(output)
+
+        return output
+
+
+# the decoded stores shared by the clients of the process ((root, size) -> XRayStore)
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def load_store(root, size):
+    # the images are decoded and resized only once (and cached on the disk, see easyFL/benchmark/xray.py)
+    with _STORES_LOCK:
+        if (root, size) not in _STORES:
+            _STORES[(root, size)] = XRayStore(root, size=size)
+        return _STORES[(root, size)]
+
+
+def load_trainset(root, batch_size=16):
+    # Resize(256) is cached, and RandomRotation(+-3) + CenterCrop(224) + Normalize are applied on the batches
+    return XRayLoader(load_store(root, 256), batch_size=batch_size, shuffle=True, train=True, device=DEVICE)
+
+
+def load_testset(root, batch_size=8):
+    # Resize(224) is cached, and Normalize is applied on the batches
+    return XRayLoader(load_store(root, 224), batch_size=batch_size, shuffle=False, train=False, device=DEVICE)
+
+
+def train(net, trainloader, epochs, privacy_engine=None):
+    criterion = torch.nn.CrossEntropyLoss()
+    optimizer = torch.optim.SGD(net.parameters(), lr=0.005, momentum=0.0)
+    if privacy_engine is not None: privacy_engine.attach(optimizer)
+    for _ in range(epochs):
+        for images, labels in tqdm(trainloader):
+            optimizer.zero_grad()
+            criterion(net(images.to(DEVICE)), labels.to(DEVICE)).backward()
+            optimizer.step()
+    if privacy_engine is not None:
+        epsilon, _ = optimizer.privacy_engine.get_privacy_spent(PRIVACY_PARAMS["target_delta"])
+        return epsilon
+    return None
+
+
+def test(net, testloader):
+    criterion = torch.nn.CrossEntropyLoss()
+    correct, total, loss = 0, 0, 0.0
+    with torch.no_grad():
+        for images, labels in tqdm(testloader):
+            outputs = net(images.to(DEVICE))
+            labels = labels.to(DEVICE)
+            loss += criterion(outputs, labels).item()
+            total += labels.size(0)
+            correct += (torch.max(outputs.data, 1)[1] == labels).sum().item()
+    return loss / len(testloader.dataset), correct / total
+
+
+class PneumoniaClient(fl.client.NumPyClient):
+    """A virtual client configured by its data folders, see the configurations at the top of this file"""
+    def __init__(self, config, compute_lock, epochs=5, batch_size=16, net=None):
+        """
+        compute_lock: the (reentrant) lock that serializes the computation of the clients of the process
+        net: the model shared by the clients of the process, and a new one is created if None or if the client uses dp
+        """
+        super().__init__()
+        self.name = config["name"]
+        self.epochs = config.get("epochs", epochs)
+        self.net = net if net is not None and not config.get("dp", False) else Net().to(DEVICE)
+        self.compute_lock = compute_lock
+        self.trainloader = load_trainset(config["train"], batch_size)
+        self.testloader = load_testset(config["test"])
+        # the malicious client switches to the fake data when the server sets changing_train_loader=1
+        self.fake_trainloader = load_trainset(config["fake_train"], batch_size) if config.get("fake_train") else None
+        self.privacy_engine = None
+        if config.get("dp", False):
+            from opacus import PrivacyEngine
+            self.privacy_engine = PrivacyEngine(
+                self.net,
+                sample_rate=batch_size / len(self.trainloader.dataset),
+                target_delta=PRIVACY_PARAMS["target_delta"],
+                max_grad_norm=PRIVACY_PARAMS["max_grad_norm"],
+                target_epsilon=PRIVACY_PARAMS["target_epsilon"],
+                epochs=90,
+            )
+
+    def get_parameters(self):
+        with self.compute_lock:
+            return [val.cpu().numpy() for _, val in self.net.state_dict().items()]
+
+    def set_parameters(self, parameters):
+        params_dict = zip(self.net.state_dict().keys(), parameters)
+        state_dict = OrderedDict({k: torch.tensor(v) for k, v in params_dict})
+        self.net.load_state_dict(state_dict, strict=True)
+
+    def fit(self, parameters, config):
+        trainloader = self.fake_trainloader if self.fake_trainloader is not None and config.get("changing_train_loader", 0) != 0 else self.trainloader
+        with self.compute_lock:
+            self.set_parameters(parameters)
+            epsilon = train(self.net, trainloader, self.epochs, self.privacy_engine)
+            parameters = self.get_parameters()
+        if epsilon is None:
+            return parameters, len(trainloader.dataset), {"client": self.name}
+        print(f"{self.name}: epsilon = {epsilon:.2f}")
+        return parameters, len(trainloader.dataset), {"epsilon": epsilon, "client": self.name}
+
+    def evaluate(self, parameters, config):
+        with self.compute_lock:
+            self.set_parameters(parameters)
+            loss, accuracy = test(self.net, self.testloader)
+        # the name lets the server attribute the metrics to the client
+        return loss, len(self.testloader.dataset), {"accuracy": accuracy, "loss": loss, "client": self.name}
+
+
+def start_clients(configs, server_address="localhost:8080", epochs=5):
+    """Connect one virtual client for each configuration to the server and wait for the end of the training"""
+    # fit() reads the parameters of the shared model while holding the lock
+    compute_lock = threading.RLock()
+    net = Net().to(DEVICE)
+    clients = [PneumoniaClient(config, compute_lock, epochs=epochs, net=net) for config in configs]
+    threads = [threading.Thread(target=fl.client.start_numpy_client, args=(server_address,), kwargs={"client": client}, name=client.name) for client in clients]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+
+def read_configs(filepath, names=None):
+    with open(filepath, "r") as inf:
+        configs = json.load(inf)
+    if names:
+        configs = [c for c in configs if c["name"] in names]
+        if not configs: raise RuntimeError("No client named {} in {}.".format(names, filepath))
+    return configs
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", help="the .json file that lists the configurations of the clients", type=str, default="clients.json")
+    parser.add_argument("--clients", help="the names of the clients to run, and all the clients in the configuration are run as default", type=str, nargs="+", default=[])
+    parser.add_argument("--server_address", type=str, default="localhost:8080")
+    parser.add_argument("--epochs", help="the number of local epochs of the clients that don't set their own", type=int, default=5)
+    args = parser.parse_args(args)
+    start_clients(read_configs(args.config, args.clients), args.server_address, args.epochs)
+
+
+if __name__ == "__main__":
+    main()